@@ -0,0 +1,245 @@
+import asyncio
+import datetime
+import glob
+import logging
+import os
+import time
+from collections import deque
+from typing import Dict, List, Optional, Set
+import httpx
+import numpy as np
+from file_lock import file_lock
+from instrumentation import metrics
+
+class AnomalyReporter:
+    """
+    Reports anomalies to the compliance service in the background.
+
+    `submit` only enqueues the serialised anomaly. A flusher task sends queued anomalies
+    in batches of up to `max_batch_size` to the bulk /report_anomalies endpoint, at least
+    every `flush_interval` seconds. Batches that cannot be delivered, and anomalies that
+    arrive while the queue is full, are appended to an on-disk spool that is replayed
+    once the compliance service accepts requests again. Batches it rejects with a client
+    error would be rejected again, so they go to `dead_letter_file` instead.
+
+    Worker processes may share the spool: appends hold a file lock, and a replay first
+    claims the whole spool by renaming it to a per-process file, so every spooled anomaly
+    is replayed by exactly one process.
+    Claims left behind by a process that died are returned to the spool on start.
+    """
+
+    def __init__(self, base_url: str, spool_file: str = "report_spool.jsonl", max_queue_size: int = 10_000,
+                 max_batch_size: int = 500, flush_interval: float = 1.0,
+                 dead_letter_file: str = "report_dead_letter.jsonl"):
+        self.base_url = base_url
+        self.spool_file = spool_file
+        self.dead_letter_file = dead_letter_file
+        self.max_queue_size = max_queue_size
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self._queue: Optional[asyncio.Queue] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._spool_lock = asyncio.Lock()
+        self._tasks: Set[asyncio.Task] = set() # spool writes started by submit()
+        self._stopping = False
+        self._batch: List[str] = [] # being built or sent by the flusher; spooled by stop() if left over
+        self._flush_latencies = deque(maxlen=1000)
+        self.reported = 0
+        self.failed_flushes = 0
+        self.spooled = 0
+        self.dead_lettered = 0
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._client = httpx.AsyncClient(base_url=self.base_url, timeout=10.0)
+        await asyncio.to_thread(self._recover_claims)
+        self._flusher = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Lets the flusher send the batch it has built, then spools whatever is left
+        (an unsent batch and anything still queued), so no anomaly is lost at shutdown.
+        """
+        self._stopping = True
+        if self._flusher:
+            try:
+                self._queue.put_nowait(None) # wakes a flusher waiting for the next anomaly
+            except asyncio.QueueFull:
+                pass # the flusher is not waiting
+            try:
+                await self._flusher
+            except Exception as e:
+                logging.error(f"Anomaly reporter flusher failed: {e}")
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        # Anything not sent is kept on disk for the next start.
+        pending, self._batch = self._batch, []
+        while self._queue and not self._queue.empty():
+            payload = self._queue.get_nowait()
+            if payload is not None:
+                pending.append(payload)
+        if pending:
+            await self._spool(pending)
+        if self._client:
+            await self._client.aclose()
+
+    def submit(self, payload: str):
+        """Queues one serialised anomaly without waiting for the compliance service."""
+        try:
+            self._queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            task = asyncio.create_task(self._spool([payload]))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self):
+        while not self._stopping:
+            batch = await self._next_batch()
+            if batch:
+                if await self._send(batch):
+                    self._batch = []
+                    if self._spool_pending() and not self._stopping:
+                        await self._replay_spool()
+                else:
+                    await self._spool(batch)
+                    self._batch = []
+            elif self._spool_pending() and not self._stopping:
+                await self._replay_spool()
+
+    async def _next_batch(self) -> List[str]:
+        loop = asyncio.get_running_loop()
+        batch = self._batch
+        deadline = loop.time() + self.flush_interval
+        while len(batch) < self.max_batch_size and not self._stopping:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                payload = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if payload is not None:
+                batch.append(payload)
+        return batch
+
+    async def _send(self, batch: List[str]) -> bool:
+        """
+        Returns False if the batch should be retried later (connection errors, 5xx, 429).
+        A batch rejected with any other client error is dead-lettered and counts as done.
+        """
+        # Payloads are already JSON, so the request body is assembled without re-encoding.
+        body = '{"anomalies": [%s]}' % ",".join(batch)
+        start = time.perf_counter()
+        try:
+            response = await self._client.post(
+                "/report_anomalies", content=body, headers={"Content-Type": "application/json"}
+            )
+        except httpx.HTTPError as e:
+            self.failed_flushes += 1
+            logging.error(f"Failed to report {len(batch)} anomalies: {e}")
+            return False
+        if response.status_code >= 500 or response.status_code == 429:
+            self.failed_flushes += 1
+            logging.error(f"Failed to report {len(batch)} anomalies: HTTP {response.status_code}")
+            return False
+        if response.is_error:
+            # Client errors will not succeed on retry.
+            await self._dead_letter(batch, f"HTTP {response.status_code}")
+            return True
+        self._flush_latencies.append(time.perf_counter() - start)
+        metrics.stages.observe(self._flush_latencies[-1], "compliance_post")
+        self.reported += len(batch)
+        return True
+
+    async def _spool(self, payloads: List[str]):
+        async with self._spool_lock:
+            await asyncio.to_thread(self._append_spool, payloads)
+        self.spooled += len(payloads)
+
+    async def _dead_letter(self, batch: List[str], error: str):
+        record = '{"failed_at": "%s", "error": "%s", "anomalies": [%s]}\n' % (
+            datetime.datetime.now().isoformat(), error, ",".join(batch))
+        await asyncio.to_thread(self._append_dead_letter, record)
+        self.dead_lettered += len(batch)
+        logging.warning(f"Dead-lettered {len(batch)} anomalies rejected by the compliance service: {error}")
+
+    def _append_dead_letter(self, record: str):
+        with file_lock(f"{self.dead_letter_file}.lock"):
+            with open(self.dead_letter_file, "a", encoding="utf-8") as f:
+                f.write(record)
+
+    def _spool_pending(self) -> bool:
+        return os.path.exists(self.spool_file) and os.path.getsize(self.spool_file) > 0
+
+    def _append_spool(self, payloads: List[str]):
+        with file_lock(f"{self.spool_file}.lock"):
+            with open(self.spool_file, "a", encoding="utf-8") as f:
+                f.write("".join(payload + "\n" for payload in payloads))
+
+    async def _replay_spool(self):
+        """Sends spooled anomalies in batches; whatever cannot be sent is spooled again."""
+        async with self._spool_lock:
+            payloads = await asyncio.to_thread(self._claim_spool)
+            sent = 0
+            while sent < len(payloads):
+                batch = payloads[sent:sent + self.max_batch_size]
+                if not await self._send(batch):
+                    break
+                sent += len(batch)
+            await asyncio.to_thread(self._release_claim, payloads[sent:])
+        if sent < len(payloads):
+            # Still unreachable; back off before the next attempt.
+            await asyncio.sleep(self.flush_interval)
+
+    def _claim_file(self, pid: int) -> str:
+        return f"{self.spool_file}.{pid}.replaying"
+
+    @staticmethod
+    def _read_lines(path: str) -> List[str]:
+        with open(path, "r", encoding="utf-8") as f:
+            return [line.rstrip("\n") for line in f if line.strip()]
+
+    def _claim_spool(self) -> List[str]:
+        """Moves the spool aside for this process; new anomalies start a fresh spool."""
+        claim = self._claim_file(os.getpid())
+        with file_lock(f"{self.spool_file}.lock"):
+            if not os.path.exists(self.spool_file):
+                return []
+            os.replace(self.spool_file, claim)
+        return self._read_lines(claim)
+
+    def _release_claim(self, unsent: List[str]):
+        claim = self._claim_file(os.getpid())
+        if unsent:
+            self._append_spool(unsent)
+        if os.path.exists(claim):
+            os.remove(claim)
+
+    def _recover_claims(self):
+        """Returns anomalies claimed by processes that died mid-replay to the spool."""
+        for claim in glob.glob(f"{glob.escape(self.spool_file)}.*.replaying"):
+            try:
+                pid = int(claim[len(self.spool_file) + 1:-len(".replaying")])
+                os.kill(pid, 0)
+                if pid != os.getpid():
+                    continue # still replaying
+            except ProcessLookupError:
+                pass
+            except (PermissionError, ValueError):
+                continue # alive under another user, or not a claim file
+            self._append_spool(self._read_lines(claim))
+            os.remove(claim)
+
+    def stats(self) -> Dict[str, float]:
+        latencies = np.fromiter(self._flush_latencies, dtype=float) * 1000
+        return {
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "reported": self.reported,
+            "failed_flushes": self.failed_flushes,
+            "spooled": self.spooled,
+            "dead_lettered": self.dead_lettered,
+            "spool_pending": self._spool_pending(),
+            "flush_latency_p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+            "flush_latency_p99_ms": float(np.percentile(latencies, 99)) if len(latencies) else 0.0,
+        }
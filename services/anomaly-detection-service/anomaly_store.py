@@ -0,0 +1,112 @@
+import datetime
+import sqlite3
+import threading
+from typing import List, Optional, Tuple
+
+PRUNE_EVERY = 1000
+
+def utc_timestamp(value: datetime.datetime) -> str:
+    """Fixed-width UTC ISO 8601, so detection times compare correctly as strings. Naive times are local."""
+    return value.astimezone(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f+00:00")
+
+class AnomalyStore:
+    """
+    Capped, persistent anomaly log in SQLite (WAL mode).
+
+    Each anomaly is stored once as its serialised JSON payload next to the indexed
+    columns used for filtering (user_id, event_type, event timestamp, detection time in UTC).
+    Row ids are monotonic, so they double as pagination cursors and delta markers.
+    Once more than `max_rows` anomalies are stored, the oldest are pruned.
+    """
+
+    def __init__(self, path: str, max_rows: int = 1_000_000):
+        self.path = path
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._since_prune = 0
+        # Worker processes share the database; writers wait for each other instead of failing.
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS anomalies (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                detected_at TEXT NOT NULL,
+                user_id TEXT,
+                event_type TEXT,
+                timestamp TEXT,
+                payload TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_anomalies_user ON anomalies (user_id, id);
+            CREATE INDEX IF NOT EXISTS idx_anomalies_event_type ON anomalies (event_type, id);
+            CREATE INDEX IF NOT EXISTS idx_anomalies_timestamp ON anomalies (timestamp);
+            CREATE INDEX IF NOT EXISTS idx_anomalies_detected_at ON anomalies (detected_at);
+        """)
+
+    def append(self, anomaly: dict, payload: str) -> int:
+        """Stores one anomaly. `payload` is its JSON serialisation, reused as-is on reads."""
+        event = anomaly.get("event", {})
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO anomalies (detected_at, user_id, event_type, timestamp, payload) VALUES (?, ?, ?, ?, ?)",
+                (utc_timestamp(datetime.datetime.now(datetime.timezone.utc)), event.get("user_id"), event.get("event_type"),
+                 event.get("timestamp"), payload)
+            )
+            self._since_prune += 1
+            if self._since_prune >= PRUNE_EVERY:
+                self._prune()
+            return cursor.lastrowid
+
+    def _prune(self):
+        self._since_prune = 0
+        self._conn.execute(
+            "DELETE FROM anomalies WHERE id <= (SELECT MAX(id) FROM anomalies) - ?", (self.max_rows,)
+        )
+
+    def query(self, cursor: Optional[int] = None, limit: int = 100, user_id: Optional[str] = None,
+              event_type: Optional[str] = None, since: Optional[str] = None) -> Tuple[List[Tuple[int, str]], Optional[int]]:
+        """
+        Returns up to `limit` (id, payload) rows after `cursor`, oldest first, and the
+        cursor to resume from: the last id returned, or `cursor` itself when there are no
+        new rows. `since` filters on detection time (ISO 8601, local time if it has no
+        offset); it raises ValueError if it cannot be parsed.
+        """
+        clauses, params = [], []
+        if cursor is not None:
+            clauses.append("id > ?")
+            params.append(cursor)
+        if user_id is not None:
+            clauses.append("user_id = ?")
+            params.append(user_id)
+        if event_type is not None:
+            clauses.append("event_type = ?")
+            params.append(event_type)
+        if since is not None:
+            clauses.append("detected_at >= ?")
+            params.append(utc_timestamp(datetime.datetime.fromisoformat(since)))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, payload FROM anomalies {where} ORDER BY id LIMIT ?", (*params, limit)
+            ).fetchall()
+        return rows, rows[-1][0] if rows else cursor
+
+    def last_id(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM anomalies").fetchone()[0]
+
+    def tail(self, after: int, limit: int = 500) -> List[Tuple[int, Optional[str], Optional[str], str]]:
+        """(id, user_id, event_type, payload) of anomalies stored after id `after`, by any process."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, user_id, event_type, payload FROM anomalies WHERE id > ? ORDER BY id LIMIT ?",
+                (after, limit)
+            ).fetchall()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM anomalies").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
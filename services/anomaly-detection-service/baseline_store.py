@@ -0,0 +1,158 @@
+import json
+import os
+import threading
+from typing import Dict, Optional, Sequence, Tuple
+import numpy as np
+from file_lock import file_lock
+
+PartitionKey = Tuple[str, str] # (user_id, event_type)
+
+class BaselineStore:
+    """
+    Incremental behavioural baseline per (user_id, event_type): a running centroid of the
+    key's embeddings, a radius estimate (the running mean squared distance to that
+    centroid) and a decayed event count, held in compact NumPy arrays.
+
+    Every update decays the key's previous weight by `decay`, so behaviour older than about
+    `half_life` of the key's events counts for half as much and gradually ages out. `score`
+    is the squared distance to the centroid divided by the radius estimate: O(d) per event
+    regardless of history size, and about 1 for typical behaviour. Keys with fewer than
+    `min_events` (decayed) events score NaN.
+
+    The arrays are memory-mapped files in `path`, shared by every worker process on the
+    host: `centroids.f32` (capacity x dim), `stats.f64` (capacity x [weight, radius]) and
+    `keys.jsonl` (one [user_id, event_type] line per row). Updates hold a file lock;
+    scores read the shared mapping directly.
+    """
+
+    def __init__(self, path: str, half_life: float = 500, min_events: float = 5):
+        self.path = path
+        self.decay = 0.5 ** (1.0 / half_life)
+        self.min_events = min_events
+        self.dim: Optional[int] = None
+        self._rows: Dict[PartitionKey, int] = {}
+        self._keys_offset = 0 # bytes of keys.jsonl already read
+        self._capacity = 0
+        self._centroids: Optional[np.memmap] = None
+        self._stats: Optional[np.memmap] = None
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        with self._lock, file_lock(self._file("lock")):
+            keys = self._file("keys.jsonl")
+            if os.path.exists(keys):
+                # Cut a key line torn by a crashed writer.
+                with open(keys, "rb") as f:
+                    content = f.read()
+                with open(keys, "r+b") as f:
+                    f.truncate(content.rfind(b"\n") + 1)
+            self._refresh()
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _refresh(self):
+        """Picks up keys added and arrays grown by other processes."""
+        manifest = self._file("manifest.json")
+        if self.dim is None:
+            if not os.path.exists(manifest):
+                return
+            with open(manifest, "r", encoding="utf-8") as f:
+                self.dim = json.load(f)["dim"]
+
+        keys = self._file("keys.jsonl")
+        if os.path.exists(keys) and os.path.getsize(keys) > self._keys_offset:
+            with open(keys, "rb") as f:
+                f.seek(self._keys_offset)
+                chunk = f.read()
+            chunk = chunk[:chunk.rfind(b"\n") + 1]
+            for line in chunk.splitlines():
+                user_id, event_type = json.loads(line)
+                self._rows[(user_id, event_type)] = len(self._rows)
+            self._keys_offset += len(chunk)
+
+        capacity = os.path.getsize(self._file("stats.f64")) // 16 if os.path.exists(self._file("stats.f64")) else 0
+        if capacity != self._capacity:
+            self._capacity = capacity
+            self._centroids = np.memmap(self._file("centroids.f32"), dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+            self._stats = np.memmap(self._file("stats.f64"), dtype=np.float64, mode="r+", shape=(capacity, 2))
+
+    def _grow(self, needed: int):
+        """Extends the array files (zero-filled) so they hold `needed` rows. Called under the file lock."""
+        if needed <= self._capacity:
+            return
+        capacity = max(1024, self._capacity * 2, needed)
+        for name, row_bytes in (("centroids.f32", self.dim * 4), ("stats.f64", 16)):
+            with open(self._file(name), "ab") as f:
+                f.truncate(capacity * row_bytes)
+        self._refresh()
+
+    def save(self):
+        """Flushes the shared arrays to disk."""
+        with self._lock:
+            if self._centroids is not None:
+                self._centroids.flush()
+                self._stats.flush()
+
+    def update(self, keys: Sequence[PartitionKey], embeddings: np.ndarray):
+        """Folds embeddings (one row per key, in order) into their keys' baselines."""
+        embeddings = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+        if not len(keys):
+            return
+        with self._lock, file_lock(self._file("lock")):
+            self._refresh()
+            if self.dim is None:
+                self.dim = embeddings.shape[1]
+                with open(self._file("manifest.json"), "w", encoding="utf-8") as f:
+                    json.dump({"dim": self.dim}, f)
+            elif embeddings.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {embeddings.shape[1]} does not match baseline dimension {self.dim}.")
+
+            new_keys = list(dict.fromkeys(key for key in keys if key not in self._rows))
+            if new_keys:
+                # Room for the rows first, then the key lines that make them visible.
+                self._grow(len(self._rows) + len(new_keys))
+                with open(self._file("keys.jsonl"), "a", encoding="utf-8") as f:
+                    f.write("".join(json.dumps(list(key)) + "\n" for key in new_keys))
+                self._refresh()
+
+            for key, embedding in zip(keys, embeddings):
+                row = self._rows[key]
+                previous_weight, radius = self._stats[row]
+                weight = previous_weight * self.decay + 1.0
+                alpha = 1.0 / weight
+                delta = embedding - self._centroids[row]
+                if previous_weight > 0:
+                    self._stats[row, 1] = radius + alpha * (float(delta @ delta) - radius)
+                self._centroids[row] += alpha * delta
+                self._stats[row, 0] = weight
+
+    def score(self, keys: Sequence[PartitionKey], embeddings: np.ndarray) -> np.ndarray:
+        """Deviation score per embedding against its key's baseline; NaN where there is none yet."""
+        embeddings = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+        scores = np.full(len(keys), np.nan)
+        with self._lock:
+            if any(key not in self._rows for key in keys):
+                self._refresh()
+            if self._stats is None:
+                return scores
+            rows = np.array([self._rows.get(key, -1) for key in keys], dtype=np.int64)
+            known = rows >= 0
+            known[known] = self._stats[rows[known], 0] >= self.min_events
+            if not known.any():
+                return scores
+            known_rows = rows[known]
+            delta = embeddings[known] - self._centroids[known_rows]
+            radius = np.maximum(self._stats[known_rows, 1], 1e-12)
+        scores[known] = np.einsum("ij,ij->i", delta, delta) / radius
+        return scores
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            self._refresh()
+            n = len(self._rows)
+            weights = self._stats[:n, 0] if self._stats is not None else np.empty(0)
+            return {
+                "keys": n,
+                "established": int((weights >= self.min_events).sum()),
+                "dim": self.dim or 0,
+            }
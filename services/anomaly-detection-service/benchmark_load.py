@@ -0,0 +1,324 @@
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import httpx
+import numpy as np
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # services/, for the shared wire module
+import wire
+from data_generator import generate_events
+from dora_incident_simulator import EXAMPLE_POLICIES, generate_data_record, generate_system_config_change
+
+SERVICE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MIX = "transactions=0.35,loan_applications=0.35,data_record=0.15,system_config=0.15"
+N_USERS = 20
+HISTORY_CHUNK = 500
+
+# --- Workload ---
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        event_type, _, weight = part.partition("=")
+        mix[event_type.strip()] = float(weight)
+    total = sum(mix.values())
+    return {event_type: weight / total for event_type, weight in mix.items()}
+
+def make_event(event_type: str, anomalous: bool, rng: random.Random) -> dict:
+    """One event of the given type. Anomalous data records and config changes violate the example policies."""
+    if event_type == "data_record":
+        age = rng.randint(8, 15) if anomalous else rng.randint(1, 5)
+        return generate_data_record(f"user_data_{rng.randint(1, N_USERS)}", age)
+    if event_type == "system_config":
+        if anomalous:
+            return generate_system_config_change(f"admin_{rng.randint(1, N_USERS)}", authorized=False, change_type="critical")
+        return generate_system_config_change(f"admin_{rng.randint(1, N_USERS)}", authorized=True, change_type="minor")
+    event, _ = generate_events(1, anomaly_rate=1.0 if anomalous else 0.0, n_users=N_USERS, event_types=[event_type])[0]
+    return event
+
+def build_workload(n_events: int, mix: Dict[str, float], anomaly_rate: float, seed: int) -> List[Tuple[dict, int]]:
+    rng = random.Random(seed)
+    np.random.seed(seed)
+    event_types, weights = zip(*mix.items())
+    workload = []
+    for _ in range(n_events):
+        event_type = rng.choices(event_types, weights)[0]
+        label = int(rng.random() < anomaly_rate)
+        workload.append((make_event(event_type, bool(label), rng), label))
+    return workload
+
+# --- Targets ---
+def rss_mb(pid: Optional[int]) -> Optional[float]:
+    """Resident set size of a process, from /proc (Linux only)."""
+    try:
+        with open(f"/proc/{pid or os.getpid()}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+class AsgiTarget:
+    """
+    Runs the anomaly service in this process and calls it through httpx's ASGI transport,
+    without a network. Service state files go to a temporary directory.
+    """
+
+    def __init__(self):
+        self.pid = None
+        self._tmp = tempfile.TemporaryDirectory()
+        self._cwd = os.getcwd()
+        self._lifespan = None
+
+    async def __aenter__(self) -> httpx.AsyncClient:
+        os.chdir(self._tmp.name)
+        sys.path.insert(0, SERVICE_DIR)
+        import main
+        self._lifespan = main.app.router.lifespan_context(main.app)
+        await self._lifespan.__aenter__()
+        await main.apply_policy_snapshot(EXAMPLE_POLICIES, "benchmark")
+        self.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://anomaly-service", timeout=120.0)
+        return self.client
+
+    async def __aexit__(self, *exc):
+        await self.client.aclose()
+        await self._lifespan.__aexit__(*exc)
+        os.chdir(self._cwd)
+        self._tmp.cleanup()
+
+class HttpTarget:
+    """Calls a running anomaly service over HTTP. Policies are created through the policy service if given."""
+
+    def __init__(self, url: str, policy_url: Optional[str], server_pid: Optional[int]):
+        self.url = url
+        self.policy_url = policy_url
+        self.pid = server_pid
+
+    async def __aenter__(self) -> httpx.AsyncClient:
+        if self.policy_url:
+            async with httpx.AsyncClient(base_url=self.policy_url) as client:
+                (await client.post("/policies/bulk", json=EXAMPLE_POLICIES)).raise_for_status()
+            await asyncio.sleep(1) # let the change feed deliver them
+        self.client = httpx.AsyncClient(base_url=self.url, timeout=120.0, limits=httpx.Limits(max_connections=1000))
+        return self.client
+
+    async def __aexit__(self, *exc):
+        await self.client.aclose()
+
+async def wait_until_ready(client: httpx.AsyncClient, timeout: float = 600.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            response = await client.get("/ready")
+            if response.status_code == 200:
+                return
+            if response.status_code == 500:
+                raise RuntimeError(f"Anomaly service failed to warm up: {response.json().get('error')}")
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.5)
+    raise RuntimeError("Anomaly service did not become ready.")
+
+async def load_history(client: httpx.AsyncClient, n_events: int, mix: Dict[str, float], seed: int):
+    history = [event for event, _ in build_workload(n_events, mix, anomaly_rate=0.0, seed=seed)]
+    for start in range(0, len(history), HISTORY_CHUNK):
+        response = await client.post("/load-historical-data", json={"events": history[start:start + HISTORY_CHUNK]})
+        response.raise_for_status()
+
+# --- Load Generation ---
+async def run_phase(client: httpx.AsyncClient, endpoint: str, workload: List[Tuple[dict, int]], rate: Optional[float],
+                    concurrency: int, batch_size: int, wire_format: str = wire.JSON) -> Dict[str, Any]:
+    """
+    Replays the workload against one endpoint. With a target `rate` (events/s) requests
+    are sent on an open-loop schedule and latency is measured from each request's
+    scheduled time, so queueing behind a slow service is not hidden. Without one, up to
+    `concurrency` requests are kept in flight. Bodies are sent and accepted in
+    `wire_format`, and the bytes on the wire are counted both ways.
+    """
+    size = 1 if endpoint == "/check-event" else batch_size
+    units = [workload[i:i + size] for i in range(0, len(workload), size)]
+    slots = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    verdicts: List[Tuple[str, int, bool]] = []
+    errors = 0
+    wire_bytes = {"sent": 0, "received": 0}
+    headers = {"Content-Type": wire_format, "Accept": wire_format}
+    loop = asyncio.get_running_loop()
+
+    async def send(unit, scheduled):
+        nonlocal errors
+        try:
+            payload = unit[0][0] if endpoint == "/check-event" else {"events": [event for event, _ in unit]}
+            content = wire.encode(payload, wire_format)
+            response = await client.post(endpoint, content=content, headers=headers)
+            response.raise_for_status()
+            latencies.append(loop.time() - scheduled)
+            wire_bytes["sent"] += len(content)
+            wire_bytes["received"] += len(response.content)
+            body = wire.decode(response.content, wire.media_type(response.headers.get("content-type")) or wire.JSON)
+            results = [body] if endpoint == "/check-event" else body["results"]
+            for (event, label), result in zip(unit, results):
+                verdicts.append((event["event_type"], label, result["is_anomaly"]))
+        except (httpx.HTTPError, ValueError, KeyError):
+            errors += 1
+        finally:
+            slots.release()
+
+    tasks = []
+    start = loop.time()
+    sent = 0
+    for unit in units:
+        scheduled = start + sent / rate if rate else loop.time()
+        delay = scheduled - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await slots.acquire()
+        tasks.append(asyncio.create_task(send(unit, scheduled if rate else loop.time())))
+        sent += len(unit)
+    await asyncio.gather(*tasks)
+    duration = loop.time() - start
+
+    return {
+        "requests": len(units),
+        "events": len(workload),
+        "errors": errors,
+        "duration_s": round(duration, 3),
+        "throughput_events_per_s": round(len(verdicts) / duration, 1) if duration else 0.0,
+        "latency_ms": latency_summary(latencies),
+        "bytes_per_event": {
+            direction: round(count / len(verdicts), 1) if verdicts else 0.0 for direction, count in wire_bytes.items()
+        },
+        "detection": detection_summary(verdicts),
+    }
+
+def latency_summary(latencies: List[float]) -> Dict[str, float]:
+    if not latencies:
+        return {}
+    values = np.array(latencies) * 1000
+    return {
+        "p50": round(float(np.percentile(values, 50)), 3),
+        "p95": round(float(np.percentile(values, 95)), 3),
+        "p99": round(float(np.percentile(values, 99)), 3),
+        "max": round(float(values.max()), 3),
+    }
+
+def detection_summary(verdicts: List[Tuple[str, int, bool]]) -> Dict[str, Any]:
+    def rates(rows):
+        labels = np.array([label for _, label, _ in rows], dtype=bool)
+        flagged = np.array([flag for _, _, flag in rows], dtype=bool)
+        return {
+            "anomalies": int(labels.sum()),
+            "recall": round(float((labels & flagged).sum() / labels.sum()), 4) if labels.sum() else None,
+            "false_positive_rate": round(float((~labels & flagged).sum() / (~labels).sum()), 4) if (~labels).sum() else None,
+        }
+    if not verdicts:
+        return {}
+    by_type = {}
+    for event_type in sorted({event_type for event_type, _, _ in verdicts}):
+        by_type[event_type] = rates([row for row in verdicts if row[0] == event_type])
+    return {**rates(verdicts), "by_event_type": by_type}
+
+# --- Regression Check ---
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Phases that got slower or less accurate than the baseline by more than `tolerance`."""
+    regressions = []
+    for endpoint, phase in results["phases"].items():
+        old = baseline.get("phases", {}).get(endpoint)
+        if not old:
+            continue
+        if phase["throughput_events_per_s"] < old["throughput_events_per_s"] * (1 - tolerance):
+            regressions.append(f"{endpoint}: throughput {phase['throughput_events_per_s']} < {old['throughput_events_per_s']}")
+        for percentile in ("p50", "p99"):
+            new_ms, old_ms = phase["latency_ms"].get(percentile), old["latency_ms"].get(percentile)
+            if new_ms is not None and old_ms is not None and new_ms > old_ms * (1 + tolerance):
+                regressions.append(f"{endpoint}: {percentile} latency {new_ms} ms > {old_ms} ms")
+        new_recall, old_recall = phase["detection"].get("recall"), old["detection"].get("recall")
+        if new_recall is not None and old_recall is not None and new_recall < old_recall - tolerance / 10:
+            regressions.append(f"{endpoint}: recall {new_recall} < {old_recall}")
+    return regressions
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SERVICE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def run_benchmark(args) -> Dict[str, Any]:
+    mix = parse_mix(args.mix)
+    workload = build_workload(args.events, mix, args.anomaly_rate, args.seed)
+    target = AsgiTarget() if args.target == "asgi" else HttpTarget(args.url, args.policy_url, args.server_pid)
+    endpoints = ["/check-event", "/check-events"] if args.endpoint == "both" else [f"/{args.endpoint}"]
+
+    async with target as client:
+        await wait_until_ready(client)
+        if args.history:
+            await load_history(client, args.history, mix, args.seed + 1)
+        memory_start = rss_mb(target.pid)
+        phases = {}
+        for endpoint in endpoints:
+            phases[endpoint] = await run_phase(client, endpoint, workload, args.rate, args.concurrency, args.batch_size,
+                                               args.wire_format)
+            print(f"{endpoint}: {phases[endpoint]['throughput_events_per_s']} events/s, "
+                  f"latency {phases[endpoint]['latency_ms']}, recall {phases[endpoint]['detection'].get('recall')}, "
+                  f"errors {phases[endpoint]['errors']}")
+        memory_end = rss_mb(target.pid)
+
+    return {
+        "timestamp": datetime.datetime.now().isoformat(),
+        "git_commit": git_commit(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "phases": phases,
+        "memory_mb": {
+            "rss_start": memory_start,
+            "rss_end": memory_end,
+            "growth": round(memory_end - memory_start, 1) if memory_start is not None and memory_end is not None else None,
+        },
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay synthetic DORA event mixes against the anomaly detection service.")
+    parser.add_argument("--target", choices=["asgi", "http"], default="asgi",
+                        help="asgi runs the service in-process without a network; http calls --url.")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--policy-url", help="Policy service to create the example policies in (http target).")
+    parser.add_argument("--server-pid", type=int, help="Process to sample memory from (http target).")
+    parser.add_argument("--endpoint", choices=["check-event", "check-events", "both"], default="both")
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--history", type=int, default=2000, help="Normal events loaded as history before the run.")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Event type weights, e.g. transactions=0.5,data_record=0.5.")
+    parser.add_argument("--anomaly-rate", type=float, default=0.05)
+    parser.add_argument("--rate", type=float, help="Target events per second (open loop). Default: as fast as possible.")
+    parser.add_argument("--concurrency", type=int, default=32, help="Maximum requests in flight.")
+    parser.add_argument("--batch-size", type=int, default=64, help="Events per /check-events request.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--wire-format", choices=wire.FORMATS, default=wire.JSON, help="Request and response encoding.")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="Earlier results file; exit with status 1 on regressions.")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative slowdown before a regression.")
+    args = parser.parse_args()
+
+    results = asyncio.run(run_benchmark(args))
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        changed = [key for key in ("target", "events", "mix", "anomaly_rate", "rate", "concurrency", "batch_size", "seed",
+                                   "wire_format")
+                   if baseline.get("config", {}).get(key) != results["config"][key]]
+        if changed:
+            print(f"Warning: workload settings differ from {args.compare}: {', '.join(changed)}")
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
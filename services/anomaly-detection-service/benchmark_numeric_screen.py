@@ -0,0 +1,75 @@
+import os
+import tempfile
+import time
+import numpy as np
+from sentence_transformers import SentenceTransformer
+from data_generator import generate_events
+from model import NumericScreener, ANOMALOUS, AMBIGUOUS
+from vector_store import VectorStore
+
+N_HISTORY = 5000
+N_EVENTS = 2000
+ANOMALY_RATE = 0.05
+BATCH_SIZE = 64
+DEVIATION_THRESHOLD = 0.4 # same threshold as main.py
+
+def event_to_string(event):
+    data_str = ", ".join([f"{k}: {v}" for k, v in event["data"].items()])
+    return f"User {event['user_id']} triggered a {event['event_type']} event with data: {data_str}"
+
+def embedding_verdicts(model, store, events):
+    """Today's path: embed every event and compare it with the user's history."""
+    verdicts = []
+    for start in range(0, len(events), BATCH_SIZE):
+        batch = events[start:start + BATCH_SIZE]
+        embeddings = model.encode([event_to_string(e) for e in batch])
+        for event, embedding in zip(batch, embeddings):
+            distances = store.query((event["user_id"], event["event_type"]), embedding, n_results=5)[0]
+            verdicts.append(not distances or np.mean(distances) > DEVIATION_THRESHOLD)
+    return verdicts
+
+def tiered_verdicts(model, store, screener, events):
+    """Numeric screen first; only ambiguous events are embedded."""
+    screened = screener.screen([(e["event_type"], e["data"]) for e in events])
+    verdicts = [verdict == ANOMALOUS for verdict in screened]
+    escalated = [i for i, verdict in enumerate(screened) if verdict == AMBIGUOUS]
+    for i, deviates in zip(escalated, embedding_verdicts(model, store, [events[i] for i in escalated])):
+        verdicts[i] = deviates
+    return verdicts, len(escalated)
+
+def score(verdicts, labels):
+    verdicts, labels = np.array(verdicts, dtype=bool), np.array(labels, dtype=bool)
+    recall = (verdicts & labels).sum() / max(labels.sum(), 1)
+    false_positive_rate = (verdicts & ~labels).sum() / max((~labels).sum(), 1)
+    return recall, false_positive_rate
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+def run_benchmark():
+    np.random.seed(42)
+    history = [event for event, _ in generate_events(N_HISTORY, anomaly_rate=0.0)]
+    events, labels = zip(*generate_events(N_EVENTS, anomaly_rate=ANOMALY_RATE))
+
+    model = SentenceTransformer('all-MiniLM-L6-v2')
+    with tempfile.TemporaryDirectory() as tmp:
+        store = VectorStore(os.path.join(tmp, "vectors"))
+        store.add(model.encode([event_to_string(e) for e in history]), [(e["user_id"], e["event_type"]) for e in history])
+        screener = NumericScreener(os.path.join(tmp, "numeric_models.joblib"))
+        _, train_s = timed(screener.add_history, [(e["event_type"], e["data"]) for e in history])
+
+        baseline, baseline_s = timed(embedding_verdicts, model, store, list(events))
+        (tiered, escalated), tiered_s = timed(tiered_verdicts, model, store, screener, list(events))
+
+    print(f"{N_HISTORY} historical events, {N_EVENTS} checked events, {sum(labels)} anomalies")
+    print(f"numeric models trained in {train_s * 1e3:.0f} ms, {escalated / N_EVENTS:.1%} of events escalated")
+    print(f"{'path':>16} {'events/s':>10} {'recall':>8} {'false pos':>10}")
+    for name, verdicts, seconds in [("embedding only", baseline, baseline_s), ("tiered", tiered, tiered_s)]:
+        recall, false_positive_rate = score(verdicts, labels)
+        print(f"{name:>16} {N_EVENTS / seconds:>10.0f} {recall:>8.1%} {false_positive_rate:>10.1%}")
+    print(f"speedup: {baseline_s / tiered_s:.1f}x")
+
+if __name__ == "__main__":
+    run_benchmark()
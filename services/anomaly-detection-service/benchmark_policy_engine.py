@@ -0,0 +1,73 @@
+import random
+import time
+from policy_engine import PolicyEngine
+
+EVENT_TYPES = ["transactions", "loan_applications", "data_record", "system_config"]
+EVENT_TYPE_POOL = EVENT_TYPES + [f"custom_type_{i}" for i in range(96)]
+POLICY_COUNTS = [10, 100, 1000, 10000]
+N_EVENTS = 2000
+
+def generate_policies(n_policies):
+    """Generates synthetic policies spread over many event types."""
+    policies = []
+    for i in range(n_policies):
+        policies.append({
+            "id": f"policy-{i}",
+            "name": f"Policy {i}",
+            "description": "Synthetic benchmark policy.",
+            "data_type": random.choice(EVENT_TYPE_POOL),
+            "rules": [
+                {"field": "amount", "operator": ">", "value": random.randint(500, 5000)},
+                {"field": "currency", "operator": "==", "value": random.choice(["USD", "EUR", "GBP"])},
+            ]
+        })
+    return policies
+
+def generate_events(n_events):
+    return [
+        (random.choice(EVENT_TYPES), {"amount": random.uniform(10, 1000), "currency": random.choice(["USD", "EUR", "GBP"])})
+        for _ in range(n_events)
+    ]
+
+def full_scan(policies, event_type, data):
+    """The original per-event scan over every policy, kept as a baseline."""
+    reason = ""
+    for policy in policies:
+        if policy['data_type'] == event_type:
+            for rule in policy['rules']:
+                field = rule['field']
+                operator = rule['operator']
+                value = rule['value']
+                if field in data:
+                    event_value = data[field]
+                    if operator == ">" and event_value > value:
+                        reason = f"Policy Violated: {policy['name']} - {field} ({event_value}) > {value}."
+                    elif operator == "<" and event_value < value:
+                        reason = f"Policy Violated: {policy['name']} - {field} ({event_value}) < {value}."
+                    elif operator == "==" and event_value == value:
+                        reason = f"Policy Violated: {policy['name']} - {field} ({event_value}) == {value}."
+    return reason
+
+def time_per_event(fn, events):
+    start = time.perf_counter()
+    for event_type, data in events:
+        fn(event_type, data)
+    return (time.perf_counter() - start) / len(events) * 1e6
+
+def run_benchmark():
+    random.seed(42)
+    events = generate_events(N_EVENTS)
+    print(f"{'policies':>10} {'compile ms':>12} {'full scan us/event':>20} {'compiled us/event':>18} {'speedup':>8}")
+    for n_policies in POLICY_COUNTS:
+        policies = generate_policies(n_policies)
+
+        start = time.perf_counter()
+        engine = PolicyEngine(policies)
+        compile_ms = (time.perf_counter() - start) * 1e3
+
+        baseline = time_per_event(lambda t, d: full_scan(policies, t, d), events)
+        compiled = time_per_event(engine.evaluate, events)
+        print(f"{n_policies:>10} {compile_ms:>12.2f} {baseline:>20.2f} {compiled:>18.2f} {baseline / compiled:>7.1f}x")
+
+if __name__ == "__main__":
+    run_benchmark()
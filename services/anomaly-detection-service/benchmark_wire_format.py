@@ -0,0 +1,71 @@
+import datetime
+import json
+import os
+import sys
+import time
+from typing import Callable, List
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # services/, for the shared wire module
+import wire
+from data_generator import generate_events
+
+N_EVENTS = 5000
+BATCH_SIZE = 500
+REPEATS = 5
+
+def best_time(fn: Callable[[], object]) -> float:
+    best = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def report(name: str, n: int, encode: Callable[[], List[bytes]], decode: Callable[[List[bytes]], object]):
+    encoded = encode()
+    size = sum(len(body) for body in encoded)
+    encode_time = best_time(encode)
+    decode_time = best_time(lambda: decode(encoded))
+    print(f"{name:<28} {size / n:>8.1f} B/event {encode_time / n * 1e6:>8.2f} us encode {decode_time / n * 1e6:>8.2f} us decode")
+
+def stdlib_dumps(obj) -> bytes:
+    return json.dumps(obj).encode()
+
+if __name__ == "__main__":
+    events = [event for event, _ in generate_events(N_EVENTS, anomaly_rate=0.05)]
+    batches = [{"events": events[i:i + BATCH_SIZE]} for i in range(0, N_EVENTS, BATCH_SIZE)]
+    anomalies = [
+        {"event": event, "reason": "Event deviates significantly from user's past behavior.",
+         "violated_policies": [], "trace_id": "5f0c2b9a1d3e4f60"}
+        for event in events
+    ]
+
+    print(f"orjson: {'yes' if wire.orjson else 'no'}, msgpack: {'yes' if wire.msgpack else 'no'}\n")
+    print(f"Ingest: /check-events bodies of {BATCH_SIZE} events")
+    report("stdlib json", N_EVENTS, lambda: [stdlib_dumps(b) for b in batches], lambda bodies: [json.loads(b) for b in bodies])
+    report("wire json", N_EVENTS, lambda: [wire.dumps(b) for b in batches], lambda bodies: [wire.loads(b) for b in bodies])
+    if wire.msgpack:
+        report("msgpack", N_EVENTS, lambda: [wire.encode(b, wire.MSGPACK) for b in batches],
+               lambda bodies: [wire.decode(b, wire.MSGPACK) for b in bodies])
+
+    # Anomalies are serialised once per anomaly and the report body is joined from the payloads.
+    print("\nReporting: anomaly payloads joined into /report_anomalies bodies")
+    def joined(dumps: Callable[[dict], bytes]) -> List[bytes]:
+        payloads = [dumps(a) for a in anomalies]
+        return [b'{"anomalies": [%s]}' % b",".join(payloads[i:i + BATCH_SIZE]) for i in range(0, N_EVENTS, BATCH_SIZE)]
+    report("stdlib json", N_EVENTS, lambda: joined(stdlib_dumps), lambda bodies: [json.loads(b) for b in bodies])
+    report("wire json", N_EVENTS, lambda: joined(wire.dumps), lambda bodies: [wire.loads(b) for b in bodies])
+
+    try:
+        from bson import ObjectId, json_util
+    except ImportError:
+        sys.exit(0)
+    print(f"\nIngest: BSON documents to JSON-safe values, batches of {BATCH_SIZE}")
+    documents = [{"_id": ObjectId(), **event["data"], "user_id": event["user_id"], "timestamp": datetime.datetime.now()}
+                 for event in events]
+    chunks = [documents[i:i + BATCH_SIZE] for i in range(0, N_EVENTS, BATCH_SIZE)]
+    for name, convert in (
+        ("json_util round trip", lambda docs: json.loads(json_util.dumps(docs))),
+        ("wire json round trip", lambda docs: wire.loads(wire.dumps(docs, default=json_util.default))),
+    ):
+        elapsed = best_time(lambda: [convert(chunk) for chunk in chunks])
+        print(f"{name:<28} {elapsed / N_EVENTS * 1e6:>8.2f} us/event")
@@ -19,3 +19,43 @@ def generate_data(n_samples=1000):
     y = np.concatenate([np.zeros(len(normal_queries)), np.ones(len(anomalous_queries))])
 
     return X, y
+
+# Normal and anomalous numeric profiles per event type: field -> (normal (loc, scale), anomalous values)
+EVENT_PROFILES = {
+    "transactions": {
+        "amount": ((250, 80), lambda: np.random.choice([np.random.uniform(20_000, 100_000), np.random.uniform(0.01, 1)])),
+        "items": ((3, 1), lambda: np.random.randint(40, 200)),
+    },
+    "loan_applications": {
+        "loan_amount": ((25_000, 8_000), lambda: np.random.uniform(500_000, 2_000_000)),
+        "credit_score": ((700, 50), lambda: np.random.uniform(300, 450)),
+        "applicant_age": ((40, 10), lambda: np.random.choice([np.random.randint(14, 18), np.random.randint(95, 110)])),
+    },
+    "data_record": {
+        "age_in_years": ((3, 1.5), lambda: np.random.uniform(12, 30)),
+    },
+}
+
+def generate_events(n_events=1000, anomaly_rate=0.05, n_users=20, event_types=None):
+    """
+    Generates labelled events for the numeric screen. Anomalous events have one numeric
+    field drawn far outside its normal range.
+    Returns a list of (event, label) pairs where label is 1 for anomalies.
+    """
+    event_types = event_types or list(EVENT_PROFILES)
+    events = []
+    for _ in range(n_events):
+        event_type = np.random.choice(event_types)
+        profile = EVENT_PROFILES[event_type]
+        data = {field: round(float(max(np.random.normal(*normal), 0)), 2) for field, (normal, _) in profile.items()}
+        label = int(np.random.rand() < anomaly_rate)
+        if label:
+            field = np.random.choice(list(profile))
+            data[field] = round(float(profile[field][1]()), 2)
+        events.append(({
+            "user_id": f"user_{np.random.randint(n_users)}",
+            "timestamp": "2025-08-01T12:00:00",
+            "event_type": str(event_type),
+            "data": data,
+        }, label))
+    return events
@@ -35,6 +35,41 @@ def generate_system_config_change(user_id, authorized=True, change_type="minor")
         }
     }
 
+# --- Example Policies ---
+EXAMPLE_POLICIES = [
+    {
+        "id": "data-retention-policy",
+        "name": "Data Retention Policy",
+        "description": "Flags data older than 7 years for GDPR compliance.",
+        "data_type": "data_record",
+        "rules": [
+            {
+                "field": "age_in_years",
+                "operator": ">",
+                "value": 7
+            }
+        ]
+    },
+    {
+        "id": "unauthorized-config-change",
+        "name": "Unauthorized Configuration Change Policy",
+        "description": "Flags any unauthorized changes to critical system configurations.",
+        "data_type": "system_config",
+        "rules": [
+            {
+                "field": "authorized_approver",
+                "operator": "==",
+                "value": False
+            },
+            {
+                "field": "change_type",
+                "operator": "==",
+                "value": "critical"
+            }
+        ]
+    }
+]
+
 # --- Main Simulation Logic ---
 def run_simulation():
     """Runs the DORA incident simulation."""
@@ -42,40 +77,7 @@ def run_simulation():
 
     # 0. Create policies (ensure they are loaded in policy service)
     print("Creating example policies...")
-    policies_to_create = [
-        {
-            "id": "data-retention-policy",
-            "name": "Data Retention Policy",
-            "description": "Flags data older than 7 years for GDPR compliance.",
-            "data_type": "data_record",
-            "rules": [
-                {
-                    "field": "age_in_years",
-                    "operator": ">",
-                    "value": 7
-                }
-            ]
-        },
-        {
-            "id": "unauthorized-config-change",
-            "name": "Unauthorized Configuration Change Policy",
-            "description": "Flags any unauthorized changes to critical system configurations.",
-            "data_type": "system_config",
-            "rules": [
-                {
-                    "field": "authorized_approver",
-                    "operator": "==",
-                    "value": False
-                },
-                {
-                    "field": "change_type",
-                    "operator": "==",
-                    "value": "critical"
-                }
-            ]
-        }
-    ]
-    for policy_data in policies_to_create:
+    for policy_data in EXAMPLE_POLICIES:
         try:
             response = requests.post(f"{POLICY_SERVICE_URL}/policies", json=policy_data)
             response.raise_for_status()
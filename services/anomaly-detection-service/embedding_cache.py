@@ -0,0 +1,97 @@
+import dbm
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence
+import numpy as np
+
+class EmbeddingCache:
+    """
+    Bounded LRU cache of sentence embeddings keyed by a hash of the text that is encoded.
+
+    `encode` looks every text up first and sends only the distinct misses to the model,
+    in one call. Entries evicted from memory are written to an optional on-disk spill
+    (a dbm file) and promoted back on their next hit.
+    """
+
+    def __init__(self, encode_fn: Callable[[List[str]], np.ndarray], max_entries: int = 100_000,
+                 spill_path: Optional[str] = None):
+        self.encode_fn = encode_fn
+        self.max_entries = max_entries
+        self.spill_path = spill_path
+        self._entries: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._spill = dbm.open(spill_path, "c") if spill_path else None
+        self.hits = 0
+        self.spill_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(text: str) -> bytes:
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+    def _lookup(self, key: bytes) -> Optional[np.ndarray]:
+        embedding = self._entries.get(key)
+        if embedding is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+        if self._spill is not None and key in self._spill:
+            embedding = np.frombuffer(self._spill[key], dtype=np.float32)
+            self.spill_hits += 1
+            self._insert(key, embedding)
+            return embedding
+        return None
+
+    def _insert(self, key: bytes, embedding: np.ndarray):
+        self._entries[key] = embedding
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            evicted_key, evicted = self._entries.popitem(last=False)
+            self.evictions += 1
+            if self._spill is not None:
+                self._spill[evicted_key] = evicted.tobytes()
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        """Returns one embedding row per text, encoding each distinct uncached text once."""
+        keys = [self.key(text) for text in texts]
+        found: Dict[bytes, np.ndarray] = {}
+        missing: Dict[bytes, str] = {}
+        with self._lock:
+            for key, text in zip(keys, texts):
+                if key in found or key in missing:
+                    continue
+                embedding = self._lookup(key)
+                if embedding is None:
+                    missing[key] = text
+                else:
+                    found[key] = embedding
+            self.misses += len(missing)
+
+        if missing:
+            encoded = np.asarray(self.encode_fn(list(missing.values())), dtype=np.float32)
+            with self._lock:
+                for key, embedding in zip(missing, encoded):
+                    found[key] = embedding
+                    self._insert(key, embedding)
+
+        if not keys:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.stack([found[key] for key in keys])
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.spill_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "spill_hits": self.spill_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits + self.spill_hits) / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        if self._spill is not None:
+            self._spill.close()
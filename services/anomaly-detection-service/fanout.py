@@ -0,0 +1,144 @@
+import asyncio
+import logging
+from typing import Dict, Iterable, Optional, Set
+from fastapi import WebSocket
+from instrumentation import metrics
+
+class Subscriber:
+    """One dashboard connection with its own bounded send queue and sender task."""
+
+    def __init__(self, websocket: WebSocket, queue_size: int,
+                 event_types: Optional[Set[str]] = None, user_ids: Optional[Set[str]] = None):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.event_types = event_types or None
+        self.user_ids = user_ids or None
+        self.dropped = 0
+        self.task: Optional[asyncio.Task] = None
+
+    def wants(self, event_type: Optional[str], user_id: Optional[str]) -> bool:
+        if self.event_types is not None and event_type not in self.event_types:
+            return False
+        if self.user_ids is not None and user_id not in self.user_ids:
+            return False
+        return True
+
+    def offer(self, message: str):
+        """Queues a message, dropping the oldest queued one if the client is lagging."""
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(message)
+
+class ConnectionManager:
+    """
+    Fans anomaly messages out to WebSocket clients without waiting on any of them.
+
+    `broadcast` takes an already serialised message and puts it on the bounded queue of
+    every client whose filters match; a per-client task drains the queue. Lagging clients
+    lose their oldest queued messages, and clients whose sends fail or time out are evicted.
+    """
+
+    def __init__(self, queue_size: int = 100, send_timeout: float = 5.0):
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.subscribers: Dict[WebSocket, Subscriber] = {}
+        self.evicted = 0
+
+    async def connect(self, websocket: WebSocket, event_types: Iterable[str] = (), user_ids: Iterable[str] = ()):
+        await websocket.accept()
+        subscriber = Subscriber(websocket, self.queue_size, set(event_types), set(user_ids))
+        subscriber.task = asyncio.create_task(self._send_loop(subscriber))
+        self.subscribers[websocket] = subscriber
+
+    def set_filters(self, websocket: WebSocket, event_types: Iterable[str] = (), user_ids: Iterable[str] = ()):
+        subscriber = self.subscribers.get(websocket)
+        if subscriber:
+            subscriber.event_types = set(event_types) or None
+            subscriber.user_ids = set(user_ids) or None
+
+    def disconnect(self, websocket: WebSocket):
+        subscriber = self.subscribers.pop(websocket, None)
+        if subscriber and subscriber.task and subscriber.task is not asyncio.current_task():
+            subscriber.task.cancel()
+
+    def broadcast(self, message: str, event_type: Optional[str] = None, user_id: Optional[str] = None):
+        for subscriber in self.subscribers.values():
+            if subscriber.wants(event_type, user_id):
+                subscriber.offer(message)
+
+    async def _send_loop(self, subscriber: Subscriber):
+        try:
+            while True:
+                message = await subscriber.queue.get()
+                with metrics.stage("websocket_send"):
+                    await asyncio.wait_for(subscriber.websocket.send_text(message), self.send_timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.warning(f"Evicting WebSocket client after failed send: {e!r}")
+            self.evicted += 1
+            self.disconnect(subscriber.websocket)
+            try:
+                await subscriber.websocket.close()
+            except Exception:
+                pass
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "clients": len(self.subscribers),
+            "queued": sum(s.queue.qsize() for s in self.subscribers.values()),
+            "dropped": sum(s.dropped for s in self.subscribers.values()),
+            "evicted": self.evicted,
+        }
+
+class AnomalyFeed:
+    """
+    Feeds this process's WebSocket clients from the shared anomaly store.
+
+    Every worker process tails the same SQLite log, so a dashboard connected to any worker
+    sees anomalies detected by all of them, at most `poll_interval` after they are stored.
+    The store is only polled while this process has clients connected.
+    """
+
+    def __init__(self, store, manager: ConnectionManager, poll_interval: float = 0.1, batch_size: int = 500):
+        self.store = store
+        self.manager = manager
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self._last_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self):
+        while True:
+            try:
+                if not self.manager.subscribers:
+                    # New clients only get anomalies stored after they connect.
+                    self._last_id = None
+                elif self._last_id is None:
+                    self._last_id = await asyncio.to_thread(self.store.last_id)
+                else:
+                    rows = await asyncio.to_thread(self.store.tail, self._last_id, self.batch_size)
+                    if rows:
+                        with metrics.stage("websocket_broadcast"):
+                            for anomaly_id, user_id, event_type, payload in rows:
+                                self.manager.broadcast(payload, event_type=event_type, user_id=user_id)
+                                self._last_id = anomaly_id
+                    if len(rows) == self.batch_size:
+                        continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning(f"Anomaly feed poll failed: {e}")
+            await asyncio.sleep(self.poll_interval)
@@ -0,0 +1,15 @@
+import contextlib
+import fcntl
+
+@contextlib.contextmanager
+def file_lock(path: str):
+    """
+    Exclusive advisory lock on `path`, held across all worker processes on the host.
+    The lock is released when the block exits or the holding process dies.
+    """
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
@@ -0,0 +1,112 @@
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+class InferenceScheduler:
+    """
+    Runs embedding inference off the event loop with micro-batching.
+
+    Single-text requests are collected for up to `batch_window_ms`, or until
+    `max_batch_size` are waiting, and encoded as one batch on a worker thread. Each
+    caller's future is resolved with its own row. At most `workers` batches run at once.
+    Latencies (submit to result) of recent requests are kept for p50/p99 reporting.
+    """
+
+    def __init__(self, encode_fn: Callable[[List[str]], np.ndarray], max_batch_size: int = 64,
+                 batch_window_ms: float = 5.0, workers: int = 2, latency_samples: int = 10_000):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window_ms / 1000
+        self.workers = workers
+        self._latencies = deque(maxlen=latency_samples)
+        self._batch_sizes = deque(maxlen=latency_samples)
+        self._queue: Optional[asyncio.Queue] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._collector: Optional[asyncio.Task] = None
+        self._in_flight: set = set()
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+        self._slots = asyncio.Semaphore(self.workers)
+        self._collector = asyncio.create_task(self._collect())
+
+    async def stop(self):
+        if self._collector:
+            self._collector.cancel()
+            try:
+                await self._collector
+            except asyncio.CancelledError:
+                pass
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+        if self._executor:
+            self._executor.shutdown(wait=False)
+
+    async def encode(self, text: str) -> np.ndarray:
+        """Encodes one text as part of the next micro-batch."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future, time.perf_counter()))
+        return await future
+
+    async def encode_batch(self, texts: Sequence[str]) -> np.ndarray:
+        """Encodes a caller-assembled batch directly on a worker thread."""
+        start = time.perf_counter()
+        async with self._slots:
+            embeddings = await asyncio.get_running_loop().run_in_executor(self._executor, self.encode_fn, list(texts))
+        self._latencies.append(time.perf_counter() - start)
+        self._batch_sizes.append(len(texts))
+        return embeddings
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._slots.acquire()
+            task = asyncio.create_task(self._run(batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future, float]]):
+        try:
+            texts = [text for text, _, _ in batch]
+            embeddings = await asyncio.get_running_loop().run_in_executor(self._executor, self.encode_fn, texts)
+            now = time.perf_counter()
+            for (_, future, submitted), embedding in zip(batch, embeddings):
+                self._latencies.append(now - submitted)
+                if not future.done():
+                    future.set_result(embedding)
+            self._batch_sizes.append(len(batch))
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._slots.release()
+
+    def stats(self) -> Dict[str, float]:
+        latencies = np.fromiter(self._latencies, dtype=float) * 1000
+        batch_sizes = np.fromiter(self._batch_sizes, dtype=float)
+        return {
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "batch_window_ms": self.batch_window * 1000,
+            "max_batch_size": self.max_batch_size,
+            "workers": self.workers,
+            "samples": len(latencies),
+            "latency_p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+            "latency_p99_ms": float(np.percentile(latencies, 99)) if len(latencies) else 0.0,
+            "mean_batch_size": float(batch_sizes.mean()) if len(batch_sizes) else 0.0,
+        }
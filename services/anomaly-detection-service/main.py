@@ -1,28 +1,90 @@
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+import time
+PROCESS_STARTED = time.perf_counter() # taken before the remaining imports so the startup report covers them
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # services/, for the shared instrumentation and wire modules
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, Query, Response
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
 import numpy as np
-from sentence_transformers import SentenceTransformer
-import chromadb
-import pandas as pd
 from fastapi.middleware.cors import CORSMiddleware
 import logging
-import requests
 import json
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
+from collections import Counter, defaultdict
+from policy_engine import PolicyEngine, Violation
+from policy_sync import PolicySubscriber
+from velocity import VelocityTracker, event_time
+from vector_store import VectorStore
+from baseline_store import BaselineStore
+from embedding_cache import EmbeddingCache
+from inference_scheduler import InferenceScheduler
+from anomaly_store import AnomalyStore
+from anomaly_reporter import AnomalyReporter
+from fanout import ConnectionManager, AnomalyFeed
+from model import NumericScreener, ANOMALOUS, AMBIGUOUS
+from model_loader import EmbeddingModel, Warmup
+from instrumentation import instrument, metrics, current_trace_id
+from wire import WireRoute, WireResponse, dumps
+import asyncio
 
 # --- Configuration ---
 logging.basicConfig(filename='anomalies.log', level=logging.INFO)
 POLICY_SERVICE_URL = "http://localhost:8005"
+COMPLIANCE_SERVICE_URL = "http://localhost:8002"
+REPORT_SPOOL_FILE = "report_spool.jsonl" # anomalies waiting for the compliance service
+REPORT_DEAD_LETTER_FILE = "report_dead_letter.jsonl" # anomalies the compliance service rejected
+WEBSOCKET_QUEUE_SIZE = 100 # messages buffered per dashboard client before the oldest are dropped
+WEBSOCKET_SEND_TIMEOUT = 5.0 # seconds before a stuck client is evicted
+WEBSOCKET_POLL_INTERVAL = 0.1 # how often each worker checks the anomaly store for anomalies to push
+POLICY_CACHE_FILE = "policy_cache.json" # last policy snapshot, shared by worker processes
+VECTOR_STORE_DIR = "vector_store"
+BASELINE_DIR = "baselines"
+BASELINE_HALF_LIFE = 500 # events of a (user_id, event_type) after which old behaviour counts half
+BASELINE_MIN_EVENTS = 5 # events needed before a baseline is used instead of k-NN
+BASELINE_NORMAL_SCORE = 2.0 # squared distance to the centroid, in units of the baseline's radius
+BASELINE_DEVIATION_SCORE = 4.0
+BASELINE_KNN_CONFIRM = True # confirm scores between the two thresholds with a k-NN query
+EMBEDDING_CACHE_SIZE = 100_000 # embeddings kept in memory
+EMBEDDING_CACHE_SPILL = None # path of an optional on-disk spill for evicted embeddings
+INFERENCE_BATCH_WINDOW_MS = 5 # how long single-event requests wait to be batched together
+INFERENCE_MAX_BATCH_SIZE = 64
+INFERENCE_WORKERS = 2 # encode threads
+ANOMALY_DB_FILE = "anomalies.db"
+ANOMALY_STORE_MAX_ROWS = 1_000_000 # oldest anomalies are pruned beyond this
+NUMERIC_MODEL_FILE = "numeric_models.joblib"
+NUMERIC_SCREEN_MARGIN = 0.05 # IsolationForest scores within this of the threshold go on to the embedding path
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDING_MODEL_CACHE = "models" # local weights; populate with `python model_loader.py --quantize avx2`
+EMBEDDING_MODEL_BACKEND = "torch" # "onnx" or "openvino" for exported CPU weights
+EMBEDDING_MODEL_FILE = None # e.g. "onnx/model_qint8_avx2.onnx" for pre-quantised weights
+EMBEDDING_MODEL_THREADS = None # torch threads per worker process; with N workers, about cores / N
+VELOCITY_DIR = "velocity" # sliding windows of window rules, shared by worker processes
+VELOCITY_BUCKETS = 10 # buckets per sliding window of a window rule
+VELOCITY_IDLE_SECONDS = 86400 # users without events for this long give up their slot in the windows
+VELOCITY_MAX_KEYS = 1_000_000 # active users per window; the window file is about 160 bytes per key with 10 buckets
+VELOCITY_NORM_HALF_LIFE = 24 # windows after which old activity counts half in a user's norm
+VELOCITY_MAX_SKEW = 300 # seconds an event timestamp may run ahead of the clock before it is clamped
+PROFILING_ENABLED = False # exposes GET /debug/profile, a sampling profiler of the running process
 
-# --- In-Memory Storage ---
-anomalies_store: List[dict] = []
+# --- Storage ---
+anomaly_store = AnomalyStore(ANOMALY_DB_FILE, max_rows=ANOMALY_STORE_MAX_ROWS)
+reporter = AnomalyReporter(COMPLIANCE_SERVICE_URL, spool_file=REPORT_SPOOL_FILE, dead_letter_file=REPORT_DEAD_LETTER_FILE)
 policies_store: Dict[str, dict] = {}
+velocity = VelocityTracker(VELOCITY_DIR, buckets=VELOCITY_BUCKETS, idle_seconds=VELOCITY_IDLE_SECONDS,
+                           max_keys=VELOCITY_MAX_KEYS, norm_half_life=VELOCITY_NORM_HALF_LIFE,
+                           max_skew=VELOCITY_MAX_SKEW)
+policy_engine = PolicyEngine()
 
 # --- FastAPI App Initialization ---
 app = FastAPI(
     title="Anomaly Detection Service",
-    description="Uses vector search and a policy engine to detect anomalous events."
+    description="Uses vector search and a policy engine to detect anomalous events.",
+    default_response_class=WireResponse,
 )
+# Endpoints accept JSON or MessagePack bodies and answer in the format the client accepts.
+app.router.route_class = WireRoute
 
 # --- CORS Middleware ---
 origins = ["http://localhost:3000"]
@@ -33,11 +95,44 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+instrument(app, "anomaly-detection", profiling=PROFILING_ENABLED)
 
 # --- ML Model and Vector DB Initialization ---
-model = SentenceTransformer('all-MiniLM-L6-v2')
-chroma_client = chromadb.Client()
-collection = chroma_client.get_or_create_collection(name="events")
+# Models load in the background after startup; until then events get policy (and, once
+# its models are loaded, numeric) checks only.
+embedding_model = EmbeddingModel(
+    EMBEDDING_MODEL_NAME, EMBEDDING_MODEL_CACHE, backend=EMBEDDING_MODEL_BACKEND, file_name=EMBEDDING_MODEL_FILE,
+    threads=EMBEDDING_MODEL_THREADS,
+)
+vector_store = VectorStore(VECTOR_STORE_DIR)
+baselines = BaselineStore(BASELINE_DIR, half_life=BASELINE_HALF_LIFE, min_events=BASELINE_MIN_EVENTS)
+baseline_decisions: Counter = Counter()
+numeric_screener = NumericScreener(NUMERIC_MODEL_FILE, margin=NUMERIC_SCREEN_MARGIN)
+embedding_cache = EmbeddingCache(embedding_model.encode, max_entries=EMBEDDING_CACHE_SIZE, spill_path=EMBEDDING_CACHE_SPILL)
+inference = InferenceScheduler(
+    embedding_cache.encode,
+    max_batch_size=INFERENCE_MAX_BATCH_SIZE,
+    batch_window_ms=INFERENCE_BATCH_WINDOW_MS,
+    workers=INFERENCE_WORKERS,
+)
+
+warmup = Warmup(PROCESS_STARTED)
+warmup.add("load_numeric_models", numeric_screener.load)
+warmup.add("import_sentence_transformers", embedding_model.import_backend)
+warmup.add("load_embedding_model", embedding_model.load)
+warmup.add("warm_up_encode", embedding_model.warm_up)
+
+# --- Metrics ---
+events_checked = metrics.counter("phalanx_events_checked_total", "Events checked, by verdict.", ["verdict"])
+metrics.gauge("phalanx_queue_depth", "Items waiting in an in-process queue.", lambda: {
+    "inference": inference.stats()["queue_depth"],
+    "reporting": reporter.stats()["queue_depth"],
+    "websocket": manager.stats()["queued"],
+}, label="queue")
+metrics.gauge("phalanx_websocket_clients", "Connected WebSocket clients.", lambda: len(manager.subscribers))
+metrics.gauge("phalanx_models_ready", "1 once the models are loaded and warmed up.", lambda: warmup.ready)
+metrics.gauge("phalanx_velocity_keys", "Users holding a slot in each sliding window.",
+              lambda: {name: stats["keys"] for name, stats in velocity.stats().items()}, label="window")
 
 # --- Pydantic Models ---
 class GenericEvent(BaseModel):
@@ -49,123 +144,318 @@ class GenericEvent(BaseModel):
 class HistoricalData(BaseModel):
     events: list[GenericEvent]
 
-# --- WebSocket Manager ---
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: list[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            await connection.send_text(message)
+class EventBatch(BaseModel):
+    events: list[GenericEvent]
 
-manager = ConnectionManager()
+# --- WebSocket Manager ---
+manager = ConnectionManager(queue_size=WEBSOCKET_QUEUE_SIZE, send_timeout=WEBSOCKET_SEND_TIMEOUT)
+anomaly_feed = AnomalyFeed(anomaly_store, manager, poll_interval=WEBSOCKET_POLL_INTERVAL)
 
 # --- Helper Functions ---
 def event_to_string(event: GenericEvent) -> str:
     data_str = ", ".join([f"{k}: {v}" for k, v in event.data.items()])
     return f"User {event.user_id} triggered a {event.event_type} event with data: {data_str}"
 
-async def load_policies():
-    """Loads policies from the policy service."""
-    try:
-        response = requests.get(f"{POLICY_SERVICE_URL}/policies")
-        response.raise_for_status()
-        policies = response.json()
-        for policy in policies:
-            policies_store[policy['id']] = policy
-        logging.info(f"Successfully loaded {len(policies)} policies.")
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Failed to load policies: {e}")
+async def apply_policy_snapshot(policies: List[dict], etag: str):
+    """Compiles a policy snapshot off the event loop and swaps it in atomically."""
+    global policies_store, policy_engine
+    new_store = {policy['id']: policy for policy in policies}
+    new_engine = await asyncio.to_thread(PolicyEngine, new_store.values(), velocity)
+    policies_store, policy_engine = new_store, new_engine
+    velocity.retain(new_engine.window_keys)
+
+policy_subscriber = PolicySubscriber(POLICY_SERVICE_URL, apply_policy_snapshot, cache_file=POLICY_CACHE_FILE)
+
+def split_filter(value: Optional[str]) -> List[str]:
+    return [item for item in value.split(",") if item] if value else []
 
 # --- API Endpoints ---
 @app.on_event("startup")
 async def startup_event():
-    await load_policies()
+    await inference.start()
+    await reporter.start()
+    await policy_subscriber.start()
+    await anomaly_feed.start()
+    await warmup.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await policy_subscriber.stop()
+    await anomaly_feed.stop()
+    await inference.stop()
+    await reporter.stop()
+    baselines.save()
+    velocity.flush()
+    embedding_cache.close()
+    anomaly_store.close()
+
+@app.get("/health")
+async def health():
+    """Liveness: the process is up and serving requests."""
+    return {"status": "ok"}
+
+@app.get("/ready")
+async def ready():
+    """
+    Readiness: 200 once the models are loaded and warmed up, 503 while they are loading,
+    500 if warm-up failed and will not recover. Includes the startup-time report.
+    """
+    status_code = 200 if warmup.ready else 500 if warmup.failed else 503
+    return JSONResponse(warmup.report(), status_code=status_code)
 
 @app.post("/load-historical-data")
 def load_historical_data(data: HistoricalData):
+    if not warmup.ready:
+        raise HTTPException(status_code=503, detail="Models are still loading.")
     try:
-        collection.add(
-            embeddings=model.encode([event_to_string(e) for e in data.events]).tolist(),
-            documents=[event_to_string(e) for e in data.events],
-            metadatas=[e.dict() for e in data.events],
-            ids=[f"{e.user_id}-{e.timestamp}-{i}" for i, e in enumerate(data.events)]
-        )
+        embeddings = embedding_cache.encode([event_to_string(e) for e in data.events])
+        keys = [(e.user_id, e.event_type) for e in data.events]
+        vector_store.add(embeddings, keys)
+        baselines.update(keys, embeddings)
+        baselines.save()
+        numeric_screener.add_history((e.event_type, e.data) for e in data.events)
         return {"message": f"Successfully loaded {len(data.events)} historical records."}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/check-event")
-async def check_event(event: GenericEvent):
-    is_anomaly = False
-    reason = ""
+DEVIATION_THRESHOLD = 0.4 # Higher threshold for general deviation
+DEVIATION_REASON = "Event deviates significantly from user's past behavior."
+NUMERIC_OUTLIER_REASON = "Event's numeric values are outliers for its event type."
 
-    # 1. Vector Search for similar past events
-    try:
-        query_embedding = model.encode(event_to_string(event)).tolist()
-        results = collection.query(
-            query_embeddings=[query_embedding],
-            n_results=5,
-            where={"user_id": event.user_id, "event_type": event.event_type}
-        )
-        distances = results['distances'][0]
-        if not distances or np.mean(distances) > 0.4: # Higher threshold for general deviation
-            is_anomaly = True
-            reason = "Event deviates significantly from user's past behavior."
+def deviates_from_history(distances: List[float]) -> bool:
+    """Returns True when an event's nearest historical neighbours are too far away."""
+    return not distances or np.mean(distances) > DEVIATION_THRESHOLD
 
-    except Exception as e:
-        logging.warning(f"Vector search failed for user {event.user_id}: {e}")
-
-    # 2. Policy-based checks
-    for policy in policies_store.values():
-        if policy['data_type'] == event.event_type:
-            for rule in policy['rules']:
-                field = rule['field']
-                operator = rule['operator']
-                value = rule['value']
-                
-                if field in event.data:
-                    event_value = event.data[field]
-                    if operator == ">" and event_value > value:
-                        is_anomaly = True
-                        reason = f"Policy Violated: {policy['name']} - {field} ({event_value}) > {value}."
-                    elif operator == "<" and event_value < value:
-                        is_anomaly = True
-                        reason = f"Policy Violated: {policy['name']} - {field} ({event_value}) < {value}."
-                    elif operator == "==" and event_value == value:
-                        is_anomaly = True
-                        reason = f"Policy Violated: {policy['name']} - {field} ({event_value}) == {value}."
+def check_policies(engine: PolicyEngine, events: List[GenericEvent]) -> List[List[Violation]]:
+    """Returns every policy rule violated by each event."""
+    with metrics.stage("policy_evaluation"):
+        return [engine.evaluate(e.event_type, e.data, e.user_id, event_time(e.timestamp)) for e in events]
 
+async def evaluate_policies(events: List[GenericEvent]) -> List[List[Violation]]:
+    """Policy violations per event, from the engine in force when the batch arrived."""
+    engine = policy_engine
+    if any(e.event_type in engine.windows for e in events):
+        # Window rules update tables shared with other workers under a file lock, which
+        # may wait on them; keep that off the event loop.
+        return await asyncio.to_thread(check_policies, engine, events)
+    return check_policies(engine, events)
+
+async def record_verdict(event: GenericEvent, is_anomaly: bool, reason: str, violated_policies: List[str]) -> dict:
+    """Stores and reports an anomaly, and builds the response for one event."""
     if is_anomaly:
-        anomaly_data = {"event": event.dict(), "reason": reason}
-        anomalies_store.append(anomaly_data)
-        logging.info(json.dumps(anomaly_data))
-        await manager.broadcast(json.dumps(anomaly_data))
-        try:
-            # Assuming compliance service is updated to handle generic events
-            requests.post("http://localhost:8002/report_anomaly", json=anomaly_data)
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Failed to report anomaly: {e}")
+        events_checked.inc("anomaly")
+        with metrics.stage("record_anomaly"):
+            anomaly_data = {
+                "event": event.dict(), "reason": reason, "violated_policies": violated_policies,
+                "trace_id": current_trace_id(),
+            }
+            # Serialised once; the store, the log, WebSocket clients and the compliance service reuse it.
+            payload = dumps(anomaly_data).decode()
+            # Off the event loop: the database is shared by worker processes and may wait on their locks.
+            await asyncio.to_thread(anomaly_store.append, anomaly_data, payload)
+            logging.info(payload)
+            # WebSocket clients of every worker are fed from the anomaly store by anomaly_feed.
+            reporter.submit(payload)
         return {"is_anomaly": True, **anomaly_data}
-        
+
+    events_checked.inc("normal")
     return {"is_anomaly": False, "event": event.dict()}
 
+async def evaluate_event(event: GenericEvent, deviation: str, violations: List[Violation]) -> dict:
+    """Combines the deviation verdict (its reason, or "") with the policy violations for one event."""
+    is_anomaly = bool(deviation)
+    reason = deviation
+
+    if violations:
+        is_anomaly = True
+        reason = " ".join(v.reason for v in violations)
+
+    violated_policies = list(dict.fromkeys(v.policy_id for v in violations))
+    return await record_verdict(event, is_anomaly, reason, violated_policies)
+
+def screen_events(events: List[GenericEvent]) -> List[str]:
+    """
+    Numeric fast path. Returns a deviation reason ("" for normal) per confidently
+    screened event, and None for events that need the embedding path.
+    """
+    with metrics.stage("numeric_screen"):
+        verdicts = numeric_screener.screen([(e.event_type, e.data) for e in events])
+    return [
+        None if verdict == AMBIGUOUS else NUMERIC_OUTLIER_REASON if verdict == ANOMALOUS else ""
+        for verdict in verdicts
+    ]
+
+def embedding_deviations(keys: List[Tuple[str, str]], embeddings: np.ndarray) -> List[str]:
+    """
+    Deviation reason ("" for normal) per embedded event. Each event is scored in O(d)
+    against its (user_id, event_type) baseline; borderline scores, and keys without an
+    established baseline, fall back to one k-NN query per key. Events judged normal are
+    folded into their baselines so the baselines follow current behaviour.
+    """
+    with metrics.stage("baseline_score"):
+        scores = baselines.score(keys, embeddings)
+    deviations = [""] * len(keys)
+    knn_groups: Dict[Tuple[str, str], List[int]] = defaultdict(list)
+    for i, score in enumerate(scores):
+        if np.isnan(score):
+            knn_groups[keys[i]].append(i)
+            baseline_decisions["no_baseline"] += 1
+        elif score > BASELINE_DEVIATION_SCORE:
+            deviations[i] = DEVIATION_REASON
+            baseline_decisions["deviating"] += 1
+        elif score > BASELINE_NORMAL_SCORE and BASELINE_KNN_CONFIRM:
+            knn_groups[keys[i]].append(i)
+            baseline_decisions["knn_confirmed"] += 1
+        else:
+            baseline_decisions["normal"] += 1
+
+    for (user_id, event_type), indices in knn_groups.items():
+        try:
+            with metrics.stage("knn_query"):
+                results = vector_store.query((user_id, event_type), embeddings[indices], n_results=5)
+            for i, distances in zip(indices, results):
+                deviations[i] = DEVIATION_REASON if deviates_from_history(distances) else ""
+        except Exception as e:
+            logging.warning(f"Vector search failed for user {user_id}: {e}")
+
+    normal = [i for i, deviation in enumerate(deviations) if not deviation]
+    if normal:
+        with metrics.stage("baseline_update"):
+            baselines.update([keys[i] for i in normal], embeddings[normal])
+    return deviations
+
+@app.post("/check-event")
+async def check_event(event: GenericEvent):
+    # 1. Numeric screen; only ambiguous events pay for an embedding
+    deviation = (await asyncio.to_thread(screen_events, [event]))[0]
+
+    # 2. Compare with the user's past behaviour, once the embedding model is loaded
+    if deviation is None:
+        deviation = ""
+        if embedding_model.ready:
+            try:
+                with metrics.stage("encode"):
+                    query_embedding = await inference.encode(event_to_string(event))
+                deviation = (await asyncio.to_thread(
+                    embedding_deviations, [(event.user_id, event.event_type)], np.atleast_2d(query_embedding)
+                ))[0]
+
+            except Exception as e:
+                logging.warning(f"Vector search failed for user {event.user_id}: {e}")
+
+    # 3. Policy-based checks
+    violations = (await evaluate_policies([event]))[0]
+    return WireResponse(await evaluate_event(event, deviation, violations))
+
+@app.post("/check-events")
+async def check_events(batch: EventBatch):
+    """
+    Checks a batch of events. The numeric screen scores the whole batch first; the
+    ambiguous events are embedded in a single encode call and scored against their
+    baselines, with any k-NN confirmations grouped into one query per
+    (user_id, event_type). Verdicts are returned in input order.
+    """
+    events = batch.events
+    if not events:
+        return WireResponse({"results": []})
+
+    # 1. Numeric screen over the whole batch
+    deviations = await asyncio.to_thread(screen_events, events)
+    escalated = [i for i, deviation in enumerate(deviations) if deviation is None]
+    for i in escalated:
+        deviations[i] = ""
+
+    # 2. Baseline scoring for the escalated events, one batched encode
+    embeddings = None
+    if escalated and embedding_model.ready:
+        try:
+            with metrics.stage("encode"):
+                embeddings = await inference.encode_batch([event_to_string(events[i]) for i in escalated])
+        except Exception as e:
+            logging.warning(f"Batch encoding failed for {len(escalated)} events: {e}")
+
+    if embeddings is not None:
+        keys = [(events[i].user_id, events[i].event_type) for i in escalated]
+        for i, deviation in zip(escalated, await asyncio.to_thread(embedding_deviations, keys, embeddings)):
+            deviations[i] = deviation
+
+    # 3. Policy-based checks, all events in one pass
+    violations = await evaluate_policies(events)
+    return WireResponse({"results": [
+        await evaluate_event(e, d, v) for e, d, v in zip(events, deviations, violations)
+    ]})
+
+@app.get("/embedding-cache/stats")
+async def get_embedding_cache_stats():
+    """Hit, miss and eviction counters for sizing the embedding cache."""
+    return embedding_cache.stats()
+
+@app.get("/numeric-screen/stats")
+async def get_numeric_screen_stats():
+    """Trained numeric models and how many events the fast path settled or escalated."""
+    return numeric_screener.stats()
+
+@app.get("/baselines/stats")
+async def get_baseline_stats():
+    """Baseline counts and how escalated events were decided: by baseline score or by k-NN."""
+    return {**baselines.stats(), "decisions": dict(baseline_decisions)}
+
+@app.get("/velocity/stats")
+async def get_velocity_stats():
+    """Active users and capacity per sliding window of the window rules, and this worker's expired, dropped, late and clamped counts."""
+    return velocity.stats()
+
+@app.get("/inference/stats")
+async def get_inference_stats():
+    """Queue depth, batch sizes and p50/p99 encode latency of the inference scheduler."""
+    return inference.stats()
+
+@app.get("/reporting/stats")
+async def get_reporting_stats():
+    """Queue depth, spool usage and flush latency of anomaly reporting to the compliance service."""
+    return reporter.stats()
+
 @app.get("/anomalies")
-async def get_anomalies():
-    return {"anomalies": anomalies_store}
+async def get_anomalies(
+    cursor: Optional[int] = Query(None, description="Return anomalies after this cursor (next_cursor of the previous page)."),
+    limit: int = Query(100, ge=1, le=1000),
+    user_id: Optional[str] = None,
+    event_type: Optional[str] = None,
+    since: Optional[str] = Query(None, description="Only anomalies detected at or after this ISO 8601 time."),
+):
+    """Pages through stored anomalies, oldest first. Pass next_cursor back to fetch only new ones."""
+    try:
+        rows, next_cursor = await asyncio.to_thread(
+            anomaly_store.query, cursor, limit, user_id, event_type, since
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="since must be an ISO 8601 time.")
+    # Payloads are stored serialised, so the page is assembled without re-encoding; the id is spliced in.
+    anomalies = ",".join('{"id": %d, %s' % (row_id, payload[1:]) for row_id, payload in rows)
+    body = '{"anomalies": [%s], "next_cursor": %s, "has_more": %s}' % (
+        anomalies, json.dumps(next_cursor), json.dumps(len(rows) == limit))
+    return Response(content=body, media_type="application/json")
 
 @app.websocket("/ws/anomalies")
-async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+async def websocket_endpoint(websocket: WebSocket, event_type: Optional[str] = None, user_id: Optional[str] = None):
+    """
+    Streams anomalies as they are detected. Optional comma-separated `event_type` and
+    `user_id` query parameters restrict the stream; a client can change its filters later
+    by sending {"event_types": [...], "user_ids": [...]}.
+    """
+    await manager.connect(websocket, split_filter(event_type), split_filter(user_id))
     try:
         while True:
-            await websocket.receive_text()
+            message = await websocket.receive_text()
+            try:
+                filters = json.loads(message)
+                manager.set_filters(websocket, filters.get("event_types", []), filters.get("user_ids", []))
+            except (ValueError, AttributeError):
+                pass
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
\ No newline at end of file
+        manager.disconnect(websocket)
+
+@app.get("/websocket/stats")
+async def get_websocket_stats():
+    """Connected clients and messages queued, dropped or evicted by the WebSocket fan-out."""
+    return manager.stats()
\ No newline at end of file
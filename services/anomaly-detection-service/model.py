@@ -1,16 +1,31 @@
+import logging
+import os
+import random
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import joblib
 import numpy as np
-from sklearn.ensemble import IsolationForest
 from data_generator import generate_data
+from file_lock import file_lock
+
+NORMAL = "normal"
+ANOMALOUS = "anomalous"
+AMBIGUOUS = "ambiguous"
+FENCE_IQRS = 3.0
 
 class AnomalyDetector:
-    def __init__(self):
-        self.model = IsolationForest(contamination=0.1)
+    def __init__(self, contamination=0.1, n_estimators=100):
+        # Imported here because scikit-learn takes most of a second to import.
+        from sklearn.ensemble import IsolationForest
+        self.model = IsolationForest(contamination=contamination, n_estimators=n_estimators)
 
-    def train(self):
+    def train(self, X=None):
         """
-        Generates data and trains the Isolation Forest model.
+        Trains the Isolation Forest model on the given rows, or on generated data.
         """
-        X, _ = generate_data()
+        if X is None:
+            X, _ = generate_data()
         self.model.fit(X)
 
     def predict(self, X):
@@ -19,3 +34,177 @@ class AnomalyDetector:
         Returns -1 for anomalies, 1 for normal data.
         """
         return self.model.predict(X)[0] == -1
+
+    def score(self, X) -> np.ndarray:
+        """
+        Scores a batch of rows in one call. Negative scores are anomalies; the further
+        from zero, the more confident the model is.
+        """
+        return self.model.decision_function(X)
+
+def numeric_features(data: Dict[str, Any]) -> Dict[str, float]:
+    """Numeric fields of an event's data. Booleans and strings are left to the policies."""
+    return {
+        field: float(value) for field, value in data.items()
+        if isinstance(value, (int, float)) and not isinstance(value, bool)
+    }
+
+class EventTypeModel:
+    """An AnomalyDetector over the numeric fields seen in one event type's history."""
+
+    def __init__(self, max_samples: int):
+        self.max_samples = max_samples
+        self.samples: List[Dict[str, float]] = []
+        self.seen = 0
+        # (fields, detector, low fences, high fences), swapped as one reference so screening never sees a mismatch.
+        self.fitted: Optional[Tuple[List[str], AnomalyDetector, np.ndarray, np.ndarray]] = None
+
+    def add(self, features: Dict[str, float]):
+        # Reservoir sampling keeps a uniform sample of the whole history in bounded memory.
+        self.seen += 1
+        if len(self.samples) < self.max_samples:
+            self.samples.append(features)
+        else:
+            slot = random.randrange(self.seen)
+            if slot < self.max_samples:
+                self.samples[slot] = features
+
+    @staticmethod
+    def matrix(rows: List[Dict[str, float]], fields: List[str]) -> np.ndarray:
+        """Feature matrix in `fields` order, with NaN for missing fields."""
+        return np.array([[row.get(field, np.nan) for field in fields] for row in rows], dtype=float).reshape(len(rows), len(fields))
+
+    def fit(self, min_samples: int, contamination: float, n_estimators: int) -> bool:
+        # Fields present in most of the history; rows missing any of them are not used.
+        counts = Counter(field for row in self.samples for field in row)
+        fields = sorted(field for field, count in counts.items() if count * 2 >= len(self.samples))
+        X = self.matrix(self.samples, fields)
+        X = X[~np.isnan(X).any(axis=1)]
+        if not fields or len(X) < min_samples:
+            return False
+        detector = AnomalyDetector(contamination=contamination, n_estimators=n_estimators)
+        detector.train(X)
+        # Trees isolate values beyond the training range no faster than the range's own edge,
+        # so far-out values are caught with Tukey fences (3 IQRs past the quartiles) instead.
+        q1, q3 = np.percentile(X, [25, 75], axis=0)
+        iqr = np.maximum(q3 - q1, 1e-9)
+        self.fitted = (fields, detector, q1 - FENCE_IQRS * iqr, q3 + FENCE_IQRS * iqr)
+        return True
+
+class NumericScreener:
+    """
+    First tier of detection: one IsolationForest per event type over the numeric fields
+    of its historical events (amounts, credit scores, ages, ...).
+
+    `screen` scores a batch with one vectorised call per event type and returns a verdict
+    per event. Scores beyond `margin` on either side of the model's threshold are
+    confident NORMAL or ANOMALOUS verdicts; everything else, including events with
+    missing fields or of event types without a trained model, is AMBIGUOUS and should
+    go on to the embedding path. Models are persisted to `path`; `load` reads them back.
+
+    Worker processes share `path`: retraining merges with the latest saved models under a
+    file lock, and `screen` reloads the models whenever another process has saved newer ones.
+    """
+
+    def __init__(self, path: str, margin: float = 0.05, min_samples: int = 50, max_samples: int = 10_000,
+                 contamination: float = 0.01, n_estimators: int = 100):
+        self.path = path
+        self.margin = margin
+        self.min_samples = min_samples
+        self.max_samples = max_samples
+        self.contamination = contamination
+        self.n_estimators = n_estimators
+        self.models: Dict[str, EventTypeModel] = {}
+        self._lock = threading.Lock()
+        self._loaded_mtime: Optional[float] = None
+        self.verdicts: Counter = Counter()
+
+    @staticmethod
+    def _mtime(path: str) -> Optional[float]:
+        return os.stat(path).st_mtime if os.path.exists(path) else None
+
+    def load(self):
+        """Reloads persisted models; until then every event is escalated."""
+        with self._lock:
+            self._load()
+
+    def _load(self):
+        mtime = self._mtime(self.path)
+        if mtime is None or mtime == self._loaded_mtime:
+            return
+        try:
+            self.models = joblib.load(self.path)
+            self._loaded_mtime = mtime
+        except Exception as e:
+            logging.warning(f"Could not load numeric models from {self.path}: {e}")
+
+    def _save(self):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        joblib.dump(self.models, tmp_path)
+        os.replace(tmp_path, self.path)
+        self._loaded_mtime = self._mtime(self.path)
+
+    def add_history(self, events: Iterable[Tuple[str, Dict[str, Any]]]):
+        """Adds historical (event_type, data) pairs and retrains the affected event types."""
+        with self._lock, file_lock(f"{self.path}.lock"):
+            self._load()
+            touched = set()
+            for event_type, data in events:
+                features = numeric_features(data)
+                if features:
+                    model = self.models.get(event_type)
+                    if model is None:
+                        model = self.models[event_type] = EventTypeModel(self.max_samples)
+                    model.add(features)
+                    touched.add(event_type)
+            for event_type in touched:
+                self.models[event_type].fit(self.min_samples, self.contamination, self.n_estimators)
+            if touched:
+                self._save()
+
+    def screen(self, events: List[Tuple[str, Dict[str, Any]]]) -> List[str]:
+        """Verdicts for a batch of (event_type, data) pairs, in input order."""
+        if self._loaded_mtime != self._mtime(self.path) and self._lock.acquire(blocking=False):
+            try:
+                self._load()
+            finally:
+                self._lock.release()
+        verdicts = [AMBIGUOUS] * len(events)
+        groups: Dict[str, List[int]] = {}
+        for i, (event_type, _) in enumerate(events):
+            groups.setdefault(event_type, []).append(i)
+
+        for event_type, indices in groups.items():
+            model = self.models.get(event_type)
+            if model is None or model.fitted is None:
+                continue
+            fields, detector, low, high = model.fitted
+            X = model.matrix([numeric_features(events[i][1]) for i in indices], fields)
+            complete = ~np.isnan(X).any(axis=1)
+            if not complete.any():
+                continue
+            scores = np.full(len(indices), np.nan)
+            scores[complete] = detector.score(X[complete])
+            outside = ((X < low) | (X > high)).any(axis=1)
+            for i, score, out in zip(indices, scores, outside):
+                if out or score < -self.margin:
+                    verdicts[i] = ANOMALOUS
+                elif score > self.margin:
+                    verdicts[i] = NORMAL
+
+        self.verdicts.update(verdicts)
+        return verdicts
+
+    def stats(self) -> Dict[str, Any]:
+        screened = sum(self.verdicts.values())
+        return {
+            "models": {
+                event_type: {"fields": model.fitted[0] if model.fitted else [], "samples": len(model.samples), "trained": model.fitted is not None}
+                for event_type, model in self.models.items()
+            },
+            "screened": screened,
+            "normal": self.verdicts[NORMAL],
+            "anomalous": self.verdicts[ANOMALOUS],
+            "escalated": self.verdicts[AMBIGUOUS],
+            "escalation_rate": self.verdicts[AMBIGUOUS] / screened if screened else 0.0,
+        }
@@ -0,0 +1,146 @@
+import argparse
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class ModelNotReady(RuntimeError):
+    pass
+
+def local_model_path(cache_dir: str, model_name: str) -> str:
+    return os.path.join(cache_dir, model_name.replace("/", "__"))
+
+class EmbeddingModel:
+    """
+    The sentence-transformer, loaded on demand instead of at import time.
+
+    `sentence_transformers` (and with it torch) is only imported by `load`. Weights are
+    read from `cache_dir`: a model saved there by `export_model` (optionally ONNX or
+    OpenVINO, optionally quantised) is used as is, otherwise the hub model is downloaded
+    into the cache once. `encode` raises ModelNotReady until `load` has finished.
+    `threads` caps torch's intra-op threads, so several worker processes do not
+    oversubscribe the cores.
+    """
+
+    def __init__(self, model_name: str, cache_dir: str, backend: str = "torch", file_name: Optional[str] = None,
+                 threads: Optional[int] = None):
+        self.model_name = model_name
+        self.cache_dir = cache_dir
+        self.backend = backend
+        self.file_name = file_name
+        self.threads = threads
+        self.source: Optional[str] = None
+        self._model = None
+
+    @property
+    def ready(self) -> bool:
+        return self._model is not None
+
+    def import_backend(self):
+        import sentence_transformers  # noqa: F401  (timed separately from loading the weights)
+
+    def load(self):
+        from sentence_transformers import SentenceTransformer
+        if self.threads:
+            import torch
+            torch.set_num_threads(self.threads)
+        kwargs: Dict[str, Any] = {"backend": self.backend}
+        if self.file_name:
+            kwargs["model_kwargs"] = {"file_name": self.file_name}
+        path = local_model_path(self.cache_dir, self.model_name)
+        if os.path.isdir(path):
+            self.source = path
+            self._model = SentenceTransformer(path, local_files_only=True, **kwargs)
+        else:
+            self.source = self.model_name
+            self._model = SentenceTransformer(self.model_name, cache_folder=self.cache_dir, **kwargs)
+
+    def warm_up(self):
+        """Runs one encode so the first real request does not pay for lazy initialisation."""
+        self.encode(["User warm_up triggered a warm_up event with data: amount: 1"])
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        model = self._model
+        if model is None:
+            raise ModelNotReady("Embedding model is still loading.")
+        return model.encode(texts)
+
+class Warmup:
+    """
+    Runs named startup steps, in order, on a background thread and times each one, so
+    the service accepts requests immediately and reports readiness once they are done.
+    """
+
+    def __init__(self, started_at: float):
+        self.started_at = started_at
+        self.steps: List[Tuple[str, Callable[[], None]]] = []
+        self.timings: Dict[str, float] = {}
+        self.state = "pending"
+        self.error: Optional[str] = None
+        self.ready_after: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, name: str, step: Callable[[], None]):
+        self.steps.append((name, step))
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    @property
+    def failed(self) -> bool:
+        return self.state == "failed"
+
+    def mark(self, name: str):
+        """Records the time from process start to now, e.g. when the app starts serving."""
+        self.timings[name] = round(time.perf_counter() - self.started_at, 3)
+
+    async def start(self):
+        self.mark("serving")
+        self._task = asyncio.create_task(asyncio.to_thread(self._run))
+
+    def _run(self):
+        self.state = "warming"
+        for name, step in self.steps:
+            start = time.perf_counter()
+            try:
+                step()
+            except Exception as e:
+                self.state = "failed"
+                self.error = f"{name}: {e}"
+                logger.error(f"Warm-up step {name} failed: {e}")
+                return
+            self.timings[name] = round(time.perf_counter() - start, 3)
+        self.ready_after = round(time.perf_counter() - self.started_at, 3)
+        self.state = "ready"
+        logger.info(f"Anomaly detection service ready after {self.ready_after}s: {self.timings}")
+
+    def report(self) -> Dict[str, Any]:
+        return {"state": self.state, "error": self.error, "ready_after_s": self.ready_after, "timings_s": self.timings}
+
+def export_model(model_name: str, cache_dir: str, backend: str, quantization: Optional[str]):
+    """Saves the model to the local cache, optionally as ONNX/OpenVINO with int8 dynamic quantisation."""
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+    path = local_model_path(cache_dir, model_name)
+    model = SentenceTransformer(model_name, cache_folder=cache_dir, backend=backend)
+    model.save(path)
+    if quantization:
+        export_dynamic_quantized_onnx_model(model, quantization, path)
+        print(f"Quantised weights written to {path}/onnx/model_qint8_{quantization}.onnx")
+    print(f"Model saved to {path}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the embedding model to the local model cache.")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--cache-dir", default="models")
+    parser.add_argument("--backend", default="onnx", choices=["torch", "onnx", "openvino"])
+    parser.add_argument("--quantize", choices=["arm64", "avx2", "avx512", "avx512_vnni"],
+                        help="Also write int8 dynamically quantised ONNX weights for this CPU target.")
+    args = parser.parse_args()
+    if args.quantize and args.backend != "onnx":
+        parser.error("--quantize requires --backend onnx")
+    export_model(args.model, args.cache_dir, args.backend, args.quantize)
@@ -0,0 +1,189 @@
+import logging
+import operator
+import re
+import time
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+from velocity import SlidingWindow, VelocityTracker, WindowKey
+
+# --- Operators ---
+def _contains(event_value: Any, value: Any) -> bool:
+    return value in event_value
+
+def _is_in(event_value: Any, value: Any) -> bool:
+    return event_value in value
+
+OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    ">": operator.gt,
+    "<": operator.lt,
+    ">=": operator.ge,
+    "<=": operator.le,
+    "==": operator.eq,
+    "!=": operator.ne,
+    "in": _is_in,
+    "contains": _contains,
+}
+REGEX_OPERATORS = {"regex", "matches"}
+COMPARISON_OPERATORS = {">", "<", ">=", "<=", "==", "!="} # the operators of window rules
+WINDOW_AGGREGATES = {"count", "sum"}
+
+class Violation(NamedTuple):
+    policy_id: str
+    policy_name: str
+    field: str
+    operator: str
+    value: Any
+    event_value: Any
+
+    @property
+    def reason(self) -> str:
+        return f"Policy Violated: {self.policy_name} - {self.field} ({self.event_value}) {self.operator} {self.value}."
+
+# --- Compiled Policies ---
+class CompiledRule:
+    """A single policy rule with its comparison function bound at compile time."""
+    __slots__ = ("field", "operator", "value", "test")
+
+    def __init__(self, field: str, op: str, value: Any):
+        self.field = field
+        self.operator = op
+        self.value = value
+        if op in REGEX_OPERATORS:
+            search = re.compile(str(value)).search
+            self.test = lambda event_value: search(str(event_value)) is not None
+        elif op in OPERATORS:
+            compare = OPERATORS[op]
+            self.test = lambda event_value: compare(event_value, value)
+        else:
+            raise ValueError(f"Unsupported operator '{op}'")
+
+    def matches(self, event_value: Any) -> bool:
+        try:
+            return bool(self.test(event_value))
+        except TypeError:
+            # Mismatched types (e.g. a string compared with a number) never match.
+            return False
+
+class CompiledWindowRule:
+    """
+    A rule on a user's count or sum of an event type over a sliding window, e.g.
+    {"type": "window", "aggregate": "count", "window_seconds": 600, "operator": ">", "value": 5}.
+    With "relative_to_norm", the window total is divided by the user's norm for the window
+    first, and the rule only applies once the user has a norm.
+    """
+    __slots__ = ("key", "relative", "label", "operator", "value", "rule")
+
+    def __init__(self, event_type: str, rule: dict):
+        aggregate = rule.get('aggregate', 'count')
+        if aggregate not in WINDOW_AGGREGATES:
+            raise ValueError(f"Unsupported aggregate '{aggregate}'")
+        field = rule['field'] if aggregate == 'sum' else None
+        window_seconds = int(rule['window_seconds'])
+        if window_seconds <= 0:
+            raise ValueError("window_seconds must be positive")
+        self.key: WindowKey = (event_type, field, window_seconds)
+        self.relative = bool(rule.get('relative_to_norm', False))
+        self.label = f"{aggregate} of {field}" if field else aggregate
+        self.label += f" over {window_seconds}s" + (" / norm" if self.relative else "")
+        self.operator = rule['operator']
+        if self.operator not in COMPARISON_OPERATORS:
+            raise ValueError(f"Unsupported window operator '{self.operator}'")
+        self.value = rule['value']
+        self.rule = CompiledRule(self.label, self.operator, self.value)
+
+    def violation(self, policy: "CompiledPolicy", totals: Dict[WindowKey, Tuple[float, Optional[float]]]) -> Optional[Violation]:
+        if self.key not in totals:
+            return None
+        total, norm = totals[self.key]
+        if self.relative:
+            if not norm:
+                return None
+            total = round(total / norm, 2)
+        elif total.is_integer():
+            total = int(total)
+        if self.rule.matches(total):
+            return Violation(policy.id, policy.name, self.label, self.operator, self.value, total)
+        return None
+
+class CompiledPolicy:
+    __slots__ = ("id", "name", "rules", "window_rules")
+
+    def __init__(self, policy: dict, windowed: bool = False):
+        self.id = policy['id']
+        self.name = policy['name']
+        self.rules: List[CompiledRule] = []
+        self.window_rules: List[CompiledWindowRule] = []
+        for rule in policy.get('rules', []):
+            try:
+                if rule.get('type') == 'window':
+                    if not windowed:
+                        raise ValueError("window rules need a velocity tracker")
+                    self.window_rules.append(CompiledWindowRule(policy['data_type'], rule))
+                else:
+                    self.rules.append(CompiledRule(rule['field'], rule['operator'], rule['value']))
+            except (KeyError, TypeError, ValueError, re.error) as e:
+                logging.warning(f"Skipping invalid rule {rule} in policy {self.id}: {e}")
+
+    def violations(self, data: Dict[str, Any], totals: Optional[Dict[WindowKey, Tuple[float, Optional[float]]]] = None) -> List[Violation]:
+        found = []
+        for rule in self.rules:
+            if rule.field in data:
+                event_value = data[rule.field]
+                if rule.matches(event_value):
+                    found.append(Violation(self.id, self.name, rule.field, rule.operator, rule.value, event_value))
+        if totals:
+            for window_rule in self.window_rules:
+                violation = window_rule.violation(self, totals)
+                if violation:
+                    found.append(violation)
+        return found
+
+class PolicyEngine:
+    """
+    Policies compiled into an index keyed by event_type, so evaluating an event
+    only touches the policies that apply to its type. Window rules are evaluated
+    against the sliding windows of `tracker`; without one they are skipped.
+    """
+
+    def __init__(self, policies: Iterable[dict] = (), tracker: Optional[VelocityTracker] = None):
+        self.index: Dict[str, List[CompiledPolicy]] = {}
+        self.windows: Dict[str, Dict[WindowKey, SlidingWindow]] = {} # updated once per event, however many rules use them
+        self.size = 0
+        for policy in policies:
+            compiled = CompiledPolicy(policy, windowed=tracker is not None)
+            self.index.setdefault(policy['data_type'], []).append(compiled)
+            for rule in compiled.window_rules:
+                self.windows.setdefault(policy['data_type'], {})[rule.key] = tracker.window(rule.key)
+            self.size += 1
+
+    @property
+    def window_keys(self) -> List[WindowKey]:
+        return [key for windows in self.windows.values() for key in windows]
+
+    def update_windows(self, event_type: str, data: Dict[str, Any], user_id: str,
+                       timestamp: Optional[float] = None) -> Dict[WindowKey, Tuple[float, Optional[float]]]:
+        """Adds the event to the user's windows. Sums skip events without a numeric value for their field."""
+        totals = {}
+        if timestamp is None:
+            timestamp = time.time()
+        for key, window in self.windows.get(event_type, {}).items():
+            field = key[1]
+            if field is None:
+                value = 1.0
+            else:
+                value = data.get(field)
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+            totals[key] = window.add(user_id, timestamp, value)
+        return totals
+
+    def evaluate(self, event_type: str, data: Dict[str, Any], user_id: Optional[str] = None,
+                 timestamp: Optional[float] = None) -> List[Violation]:
+        """
+        Returns every rule violation for the event, grouped by policy in load order.
+        Window rules need the event's `user_id` and `timestamp` (seconds since the epoch).
+        """
+        totals = self.update_windows(event_type, data, user_id, timestamp) if user_id is not None else None
+        violations: List[Violation] = []
+        for policy in self.index.get(event_type, ()):
+            violations.extend(policy.violations(data, totals))
+        return violations
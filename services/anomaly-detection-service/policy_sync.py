@@ -0,0 +1,119 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Awaitable, Callable, List, Optional
+import httpx
+
+FEED_TIMEOUT_SECONDS = 30
+POLL_INTERVAL_SECONDS = 10
+# A malformed snapshot fails with one of these; the last good policy set stays in force.
+SNAPSHOT_ERRORS = (ValueError, KeyError, TypeError)
+
+class PolicySubscriber:
+    """
+    Keeps the detector's policy table in sync with the policy service.
+
+    Follows the long-poll change feed at /policies/changes and falls back to
+    conditional GETs on /policies (If-None-Match) while the feed is unavailable.
+    Every new snapshot is handed to `on_snapshot` together with its ETag.
+
+    With a `cache_file`, each snapshot is also kept on local disk. A starting worker
+    applies the cached snapshot first, so it has policies before the policy service
+    answers, and its first GET is conditional (usually a 304).
+    """
+
+    def __init__(self, base_url: str, on_snapshot: Callable[[List[dict], str], Awaitable[None]],
+                 feed_timeout: int = FEED_TIMEOUT_SECONDS, poll_interval: float = POLL_INTERVAL_SECONDS,
+                 cache_file: Optional[str] = None):
+        self.base_url = base_url
+        self.on_snapshot = on_snapshot
+        self.cache_file = cache_file
+        self.feed_timeout = feed_timeout
+        self.poll_interval = poll_interval
+        self.etag: Optional[str] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        # The read timeout has to outlive the server-side long-poll.
+        self._client = httpx.AsyncClient(base_url=self.base_url, timeout=httpx.Timeout(10.0, read=self.feed_timeout + 10))
+        cached = await asyncio.to_thread(self._read_cache)
+        if cached:
+            try:
+                await self.on_snapshot(cached["policies"], cached["etag"])
+                self.etag = cached["etag"] or None
+            except SNAPSHOT_ERRORS as e:
+                logging.warning(f"Ignoring unusable policy cache {self.cache_file}: {e!r}")
+        await self.refresh()
+        self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._client:
+            await self._client.aclose()
+
+    async def refresh(self) -> bool:
+        """Conditional GET of the full policy list. Returns True if a new snapshot was applied."""
+        headers = {"If-None-Match": self.etag} if self.etag else {}
+        try:
+            response = await self._client.get("/policies", headers=headers)
+            if response.status_code == 304:
+                return False
+            response.raise_for_status()
+            await self._apply(response.json(), response.headers.get("ETag", ""))
+            return True
+        except httpx.HTTPError as e:
+            logging.error(f"Failed to load policies: {e}")
+            return False
+        except SNAPSHOT_ERRORS as e:
+            logging.error(f"Ignoring malformed policy snapshot from /policies: {e!r}")
+            return False
+
+    async def _watch(self):
+        while True:
+            try:
+                response = await self._client.get(
+                    "/policies/changes",
+                    params={"etag": self.etag or "", "timeout": self.feed_timeout}
+                )
+                if response.status_code == 304:
+                    continue
+                response.raise_for_status()
+                snapshot = response.json()
+                await self._apply(snapshot["policies"], snapshot["etag"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning(f"Policy change feed unavailable, falling back to polling: {e}")
+                await self.refresh()
+                await asyncio.sleep(self.poll_interval)
+
+    async def _apply(self, policies: List[dict], etag: str):
+        await self.on_snapshot(policies, etag)
+        self.etag = etag or None
+        if self.cache_file:
+            await asyncio.to_thread(self._write_cache, policies, etag)
+        logging.info(f"Successfully loaded {len(policies)} policies (etag {etag}).")
+
+    def _read_cache(self) -> Optional[dict]:
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return None
+        try:
+            with open(self.cache_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except ValueError as e:
+            logging.warning(f"Ignoring unreadable policy cache {self.cache_file}: {e}")
+            return None
+
+    def _write_cache(self, policies: List[dict], etag: str):
+        # Every worker writes the same snapshot; a per-process temp file keeps the swap atomic.
+        tmp_file = f"{self.cache_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump({"etag": etag, "policies": policies}, f)
+        os.replace(tmp_file, self.cache_file)
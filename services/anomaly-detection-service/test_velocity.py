@@ -0,0 +1,34 @@
+import time
+from policy_engine import PolicyEngine
+from velocity import VelocityTracker
+
+VOLUME_POLICY = {
+    "id": "volume",
+    "name": "Hourly volume over 5x the user's norm",
+    "data_type": "transactions",
+    "rules": [{"type": "window", "aggregate": "sum", "field": "amount", "window_seconds": 3600,
+               "operator": ">", "value": 5, "relative_to_norm": True}],
+}
+
+def replay(engine, start, end, interval, amount=100.0):
+    """Sends one transaction every `interval` seconds; returns the timestamps that were flagged."""
+    flagged = []
+    t = start
+    while t <= end:
+        if engine.evaluate("transactions", {"amount": amount}, "user_1", t):
+            flagged.append(t)
+        t += interval
+    return flagged
+
+def test_steady_traffic_is_not_flagged(tmp_path):
+    engine = PolicyEngine([VOLUME_POLICY], VelocityTracker(str(tmp_path), max_keys=1000))
+    now = time.time()
+    # A transaction every 6 minutes for 8 hours, ending now.
+    assert replay(engine, now - 8 * 3600, now, 360) == []
+
+def test_burst_over_the_norm_is_flagged(tmp_path):
+    engine = PolicyEngine([VOLUME_POLICY], VelocityTracker(str(tmp_path), max_keys=1000))
+    now = time.time()
+    assert replay(engine, now - 8 * 3600, now - 600, 360) == []
+    # Ten times the usual hourly volume within ten minutes.
+    assert replay(engine, now - 599, now, 6)
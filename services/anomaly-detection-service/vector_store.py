@@ -0,0 +1,205 @@
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from file_lock import file_lock
+
+PartitionKey = Tuple[str, str] # (user_id, event_type)
+
+class VectorStore:
+    """
+    Persistent, memory-mapped store of event embeddings partitioned by (user_id, event_type).
+
+    On-disk layout in `path`:
+      embeddings.f32   all embeddings as one append-only float32 matrix (rows x dim)
+      partitions.i32   the partition id of every row, in row order
+      partitions.jsonl one [user_id, event_type] line per partition id
+      manifest.json    the embedding dimension
+      lock             serialises appends across worker processes
+
+    Cold start maps the embedding file and groups row ids by partition with one argsort,
+    so nothing is re-encoded. Appends write to the end of the files under the lock. Every
+    process, including the writer, picks up rows appended since its last look by reading
+    only the new tail of the files, so all workers on a host share one store. Queries are
+    exact nearest-neighbour searches over one partition, using squared L2 distance like
+    Chroma's default space.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.dim: Optional[int] = None
+        self.rows = 0
+        self._lock = threading.Lock()
+        self._keys: List[PartitionKey] = []
+        self._keys_offset = 0 # bytes of partitions.jsonl already read
+        self._partition_ids: Dict[PartitionKey, int] = {}
+        self._index: Dict[PartitionKey, np.ndarray] = {}
+        self._mmap: Optional[np.memmap] = None
+        os.makedirs(path, exist_ok=True)
+        with self._lock, file_lock(self._file("lock")):
+            self._repair()
+            self._refresh()
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    @staticmethod
+    def _size(file: str) -> int:
+        return os.path.getsize(file) if os.path.exists(file) else 0
+
+    # --- Loading ---
+    def _read_dim(self):
+        manifest = self._file("manifest.json")
+        if self.dim is None and os.path.exists(manifest):
+            with open(manifest, "r", encoding="utf-8") as f:
+                self.dim = json.load(f)["dim"]
+
+    def _repair(self):
+        """Cuts torn tails left by a writer that crashed. Must be called under the file lock."""
+        self._read_dim()
+        names = self._file("partitions.jsonl")
+        if self._size(names):
+            with open(names, "rb") as f:
+                content = f.read()
+            self._truncate(names, content.rfind(b"\n") + 1)
+        if self.dim is None:
+            return
+        # The two row files can end up at different lengths; keep the common prefix.
+        row_bytes = self.dim * 4
+        rows = min(self._size(self._file("embeddings.f32")) // row_bytes, self._size(self._file("partitions.i32")) // 4)
+        self._truncate(self._file("embeddings.f32"), rows * row_bytes)
+        self._truncate(self._file("partitions.i32"), rows * 4)
+
+    @staticmethod
+    def _truncate(file: str, size: int):
+        if os.path.exists(file) and os.path.getsize(file) > size:
+            with open(file, "r+b") as f:
+                f.truncate(size)
+
+    def _refresh(self):
+        """Indexes partitions and rows appended (by any process) since the last refresh."""
+        names = self._file("partitions.jsonl")
+        if self._size(names) > self._keys_offset:
+            with open(names, "rb") as f:
+                f.seek(self._keys_offset)
+                chunk = f.read()
+            chunk = chunk[:chunk.rfind(b"\n") + 1] # a line still being written is read next time
+            for line in chunk.splitlines():
+                user_id, event_type = json.loads(line)
+                self._partition_ids[(user_id, event_type)] = len(self._keys)
+                self._keys.append((user_id, event_type))
+            self._keys_offset += len(chunk)
+
+        self._read_dim()
+        if self.dim is None:
+            return
+        rows = min(self._size(self._file("embeddings.f32")) // (self.dim * 4), self._size(self._file("partitions.i32")) // 4)
+        if rows <= self.rows:
+            return
+
+        start = self.rows
+        row_partitions = np.fromfile(self._file("partitions.i32"), dtype=np.int32, count=rows - start, offset=start * 4)
+        known = row_partitions < len(self._keys)
+        if not known.all():
+            # Partition names are written before rows, so this only guards against torn files.
+            row_partitions = row_partitions[:np.argmin(known)]
+            rows = start + len(row_partitions)
+            if rows == start:
+                return
+
+        self.rows = rows
+        # Map the grown file before publishing the new rows to readers.
+        self._remap()
+        order = np.argsort(row_partitions, kind="stable")
+        boundaries = np.flatnonzero(np.diff(row_partitions[order])) + 1
+        for group in np.split(order, boundaries):
+            key = self._keys[row_partitions[group[0]]]
+            new_rows = group.astype(np.int64) + start
+            existing = self._index.get(key)
+            self._index[key] = new_rows if existing is None else np.concatenate([existing, new_rows])
+
+    def _maybe_refresh(self):
+        if self._size(self._file("partitions.i32")) > self.rows * 4:
+            with self._lock:
+                self._refresh()
+
+    def _remap(self):
+        if self.rows:
+            self._mmap = np.memmap(self._file("embeddings.f32"), dtype=np.float32, mode="r", shape=(self.rows, self.dim))
+
+    # --- Writes ---
+    def add(self, embeddings: np.ndarray, keys: Sequence[PartitionKey]):
+        """Appends embeddings, one partition key per row."""
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if embeddings.ndim != 2 or len(embeddings) != len(keys):
+            raise ValueError("Expected one embedding row per partition key.")
+        if not len(keys):
+            return
+
+        with self._lock, file_lock(self._file("lock")):
+            self._repair()
+            self._refresh()
+            if self.dim is None:
+                self.dim = embeddings.shape[1]
+                with open(self._file("manifest.json"), "w", encoding="utf-8") as f:
+                    json.dump({"dim": self.dim}, f)
+            elif embeddings.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {embeddings.shape[1]} does not match store dimension {self.dim}.")
+
+            # New partitions get the next ids in file order; _refresh reads them back below.
+            new_ids: Dict[PartitionKey, int] = {}
+            row_partitions = np.empty(len(keys), dtype=np.int32)
+            for i, key in enumerate(keys):
+                partition_id = self._partition_ids.get(key)
+                if partition_id is None:
+                    partition_id = new_ids.setdefault(key, len(self._keys) + len(new_ids))
+                row_partitions[i] = partition_id
+
+            # Partition names first, so every row on disk refers to a known partition.
+            if new_ids:
+                with open(self._file("partitions.jsonl"), "a", encoding="utf-8") as f:
+                    f.write("".join(json.dumps(list(key)) + "\n" for key in new_ids))
+            with open(self._file("embeddings.f32"), "ab") as f:
+                embeddings.tofile(f)
+            with open(self._file("partitions.i32"), "ab") as f:
+                row_partitions.tofile(f)
+            self._refresh()
+
+    # --- Queries ---
+    def count(self, key: Optional[PartitionKey] = None) -> int:
+        self._maybe_refresh()
+        if key is None:
+            return self.rows
+        rows = self._index.get(key)
+        return 0 if rows is None else len(rows)
+
+    def partition(self, key: PartitionKey) -> np.ndarray:
+        """All embeddings stored for one partition."""
+        self._maybe_refresh()
+        rows = self._index.get(key)
+        mmap = self._mmap
+        if rows is None or mmap is None:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        return mmap[rows]
+
+    def query(self, key: PartitionKey, query_embeddings: np.ndarray, n_results: int = 5) -> List[List[float]]:
+        """
+        Returns, for every query embedding, the ascending squared L2 distances to its
+        `n_results` nearest neighbours within the partition.
+        """
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        vectors = self.partition(key)
+        if not len(vectors):
+            return [[] for _ in range(len(queries))]
+
+        distances = (
+            np.einsum("ij,ij->i", vectors, vectors)[None, :]
+            - 2.0 * queries @ vectors.T
+            + np.einsum("ij,ij->i", queries, queries)[:, None]
+        )
+        np.maximum(distances, 0.0, out=distances)
+        k = min(n_results, vectors.shape[0])
+        nearest = np.partition(distances, k - 1, axis=1)[:, :k] if k < vectors.shape[0] else distances
+        nearest.sort(axis=1)
+        return nearest[:, :k].tolist()
@@ -0,0 +1,256 @@
+import datetime
+import hashlib
+import math
+import mmap
+import os
+import time
+from typing import Dict, Iterable, Optional, Tuple
+from urllib.parse import quote
+import numpy as np
+from file_lock import file_lock
+
+WindowKey = Tuple[str, Optional[str], int] # (event_type, summed field or None for a count, window_seconds)
+
+LOAD_FACTOR = 0.75 # home slots per window are max_keys / LOAD_FACTOR
+MAX_PROBES = 64 # slots searched for a user before its event is dropped
+LAYOUT_VERSION = 2 # part of the file name; bump when the table layout changes
+HEADER_BYTES = 64 # file header: the number of slots holding a user
+
+def event_time(timestamp: Optional[str]) -> float:
+    """Seconds since the epoch of an ISO 8601 event timestamp; the current time if there is none."""
+    if timestamp:
+        try:
+            return datetime.datetime.fromisoformat(timestamp).timestamp()
+        except (TypeError, ValueError):
+            pass
+    return time.time()
+
+def user_hash(user_id: str) -> int:
+    """Nonzero 64-bit key of a user in the window tables; 0 marks an empty slot."""
+    return int.from_bytes(hashlib.blake2b(user_id.encode(), digest_size=8).digest(), "little") or 1
+
+class SlidingWindow:
+    """
+    Per-user count or sum of one event type over the last `window_seconds`.
+
+    Each user has a ring of `buckets` time buckets (each window_seconds / buckets long)
+    plus the running total of the ring. `add` is O(1): it clears the buckets the user's
+    clock has moved past, adds the value to the event's bucket and returns the total for
+    the window ending at the event. Events older than the window are not counted, and
+    event times more than `max_skew` seconds ahead of the wall clock are clamped to it.
+
+    Every completed bucket is also folded into a decayed average with a half-life of
+    `norm_half_life` windows, the user's norm. `norm` is the expected window total,
+    bias-corrected for the history seen so far and reported once the user has
+    `norm_min_windows` windows of it.
+
+    Users live in a fixed-size open-addressing table in a memory-mapped file, shared by
+    every worker process on the host; updates hold a file lock. A user is found by
+    hashing its id to a home slot and probing linearly from there, up to MAX_PROBES slots
+    and no further than the first empty one, so a lookup usually touches a single page.
+    Users idle for `idle_seconds` of wall-clock time have stale slots, which new users
+    take over, so the table holds at most `max_keys` active users in bounded memory.
+    When all the slots a new user could take are active, its events are not counted
+    (`dropped`).
+    """
+
+    def __init__(self, path: str, window_seconds: float, buckets: int = 10, idle_seconds: float = 86400,
+                 max_keys: int = 1_000_000, norm_half_life: float = 24, norm_min_windows: float = 1,
+                 max_skew: float = 300):
+        self.path = path
+        self.window_seconds = window_seconds
+        self.buckets = buckets
+        self.bucket_seconds = window_seconds / buckets
+        self.idle_buckets = max(buckets, math.ceil(idle_seconds / self.bucket_seconds))
+        self.capacity = math.ceil(max_keys / LOAD_FACTOR) # home slots
+        self.max_skew = max_skew
+        self.decay = 0.5 ** (1.0 / (norm_half_life * buckets)) # per bucket
+        self.norm_min_buckets = norm_min_windows * buckets
+        # Counters for this process.
+        self.expired = 0
+        self.dropped = 0
+        self.late = 0
+        self.clamped = 0
+
+        dtype = np.dtype([
+            ("key", "<u8"),
+            ("last", "<i8"), # latest bucket seen
+            ("first", "<i8"), # first bucket seen
+            ("total", "<f8"),
+            ("norm", "<f8"), # decayed average bucket total
+            ("ring", "<f8", (buckets,)),
+        ])
+        # Probes run past the last home slot instead of wrapping around.
+        slots = self.capacity + MAX_PROBES - 1
+        size = HEADER_BYTES + slots * dtype.itemsize
+        with file_lock(f"{path}.lock"):
+            # Zero-filled, so the file is sparse on disk. Pages are mapped in as users arrive:
+            # about one 4 KB page per user while users are few, and the whole file once
+            # there are more users than pages.
+            with open(path, "ab") as f:
+                if f.tell() < size:
+                    f.truncate(size)
+        self._used = np.memmap(path, dtype="<i8", mode="r+", shape=(1,))
+        table = np.memmap(path, dtype=dtype, mode="r+", offset=HEADER_BYTES, shape=(slots,))
+        # Users are scattered over the table, so reading ahead would map in neighbouring
+        # pages no user needs.
+        table._mmap.madvise(mmap.MADV_RANDOM)
+        self._key = table["key"]
+        self._last = table["last"]
+        self._first = table["first"]
+        self._total = table["total"]
+        self._norm = table["norm"]
+        self._ring = table["ring"]
+        self._table = table
+
+    def _slot(self, key: int, bucket: int, now: int) -> Optional[int]:
+        """The user's slot, taking over a stale or empty one for a new user; None if there is none."""
+        # Slots are never emptied again, only taken over, so a user is always found
+        # before the first empty slot of its probe sequence.
+        key = np.uint64(key)
+        home = int(key % np.uint64(self.capacity))
+        stale = empty = None
+        for slot in range(home, home + MAX_PROBES):
+            held = self._key[slot]
+            if held == key:
+                return slot
+            if held == 0:
+                empty = slot
+                break
+            if stale is None and self._last[slot] < now - self.idle_buckets:
+                stale = slot
+        if stale is not None:
+            slot = stale
+            self.expired += 1
+        elif empty is not None:
+            slot = empty
+            self._used[0] += 1
+        else:
+            return None
+        self._key[slot] = key
+        self._ring[slot] = 0.0
+        self._total[slot] = 0.0
+        self._last[slot] = bucket
+        self._first[slot] = bucket
+        self._norm[slot] = 0.0
+        return slot
+
+    def _advance(self, slot: int, bucket: int):
+        """Moves the user's clock forward to `bucket`, folding completed buckets into the norm."""
+        last = int(self._last[slot])
+        ring = self._ring[slot]
+        gap = bucket - last
+        # The latest bucket is now complete, followed by gap - 1 empty ones.
+        norm = self.decay * self._norm[slot] + (1.0 - self.decay) * ring[last % self.buckets]
+        self._norm[slot] = norm * self.decay ** (gap - 1)
+        if gap >= self.buckets:
+            ring[:] = 0.0
+            self._total[slot] = 0.0
+        else:
+            for b in range(last + 1, bucket + 1):
+                i = b % self.buckets
+                self._total[slot] -= ring[i]
+                ring[i] = 0.0
+        self._last[slot] = bucket
+
+    def add(self, user_id: str, timestamp: float, value: float = 1.0) -> Tuple[float, Optional[float]]:
+        """
+        Counts `value` for the user at `timestamp` (seconds). Returns the user's window
+        total and norm (None until established). The total is 0.0 for events that were
+        dropped or are older than the user's window.
+        """
+        wall = time.time()
+        if timestamp > wall + self.max_skew:
+            timestamp = wall + self.max_skew
+            self.clamped += 1
+        bucket = int(timestamp // self.bucket_seconds)
+        key = user_hash(user_id)
+
+        with file_lock(f"{self.path}.lock"):
+            slot = self._slot(key, bucket, int(wall // self.bucket_seconds))
+            if slot is None:
+                self.dropped += 1
+                return 0.0, None
+            last = self._last[slot]
+            if bucket > last:
+                self._advance(slot, bucket)
+            elif bucket <= last - self.buckets:
+                self.late += 1
+                return 0.0, None
+
+            self._ring[slot, bucket % self.buckets] += value
+            self._total[slot] += value
+            total = float(self._total[slot])
+            seen = int(self._last[slot] - self._first[slot]) # completed buckets folded into the norm
+            if seen < max(self.norm_min_buckets, 1):
+                return total, None
+            # The decayed average starts at zero; dividing by the weight of the buckets seen
+            # so far removes that bias, so a new user's norm is the mean of its history.
+            norm = float(self._norm[slot]) / (1.0 - self.decay ** seen)
+            return total, norm * self.buckets
+
+    def flush(self):
+        self._table.flush()
+        self._used.flush()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "window_seconds": self.window_seconds,
+            "keys": int(self._used[0]), # users holding a slot, idle ones until it is taken over
+            "capacity": self.capacity,
+            "expired": self.expired,
+            "dropped": self.dropped,
+            "late": self.late,
+            "clamped": self.clamped,
+        }
+
+class VelocityTracker:
+    """
+    The sliding windows used by windowed policy rules, one per (event_type, field,
+    window_seconds) and shared by every rule that needs it. Each window is a file in
+    `path`, so all worker processes count into the same windows and counts survive
+    policy updates and restarts.
+    """
+
+    def __init__(self, path: str, buckets: int = 10, idle_seconds: float = 86400, max_keys: int = 1_000_000,
+                 norm_half_life: float = 24, norm_min_windows: float = 1, max_skew: float = 300):
+        self.path = path
+        self.buckets = buckets
+        self.idle_seconds = idle_seconds
+        self.max_keys = max_keys
+        self.options = dict(norm_half_life=norm_half_life, norm_min_windows=norm_min_windows, max_skew=max_skew)
+        self.windows: Dict[WindowKey, SlidingWindow] = {}
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, key: WindowKey) -> str:
+        event_type, field, window_seconds = key
+        # The layout is part of the name, so a change of buckets or max_keys starts a new table.
+        name = f"{quote(event_type, safe='')}.{quote(field, safe='') if field else '#count'}.{window_seconds}s"
+        capacity = math.ceil(self.max_keys / LOAD_FACTOR)
+        return os.path.join(self.path, f"{name}.v{LAYOUT_VERSION}.{self.buckets}x{capacity}.window")
+
+    def window(self, key: WindowKey) -> SlidingWindow:
+        window = self.windows.get(key)
+        if window is None:
+            window = self.windows[key] = SlidingWindow(
+                self._file(key), key[2], buckets=self.buckets, idle_seconds=max(self.idle_seconds, key[2]),
+                max_keys=self.max_keys, **self.options,
+            )
+        return window
+
+    def retain(self, keys: Iterable[WindowKey]):
+        """Drops windows no rule uses any more; their files stay for other workers."""
+        keep = set(keys)
+        for key in list(self.windows):
+            if key not in keep:
+                del self.windows[key]
+
+    def flush(self):
+        for window in list(self.windows.values()):
+            window.flush()
+
+    def stats(self) -> Dict[str, dict]:
+        return {
+            f"{event_type}:{field or 'count'}:{window_seconds}s": window.stats()
+            for (event_type, field, window_seconds), window in list(self.windows.items())
+        }
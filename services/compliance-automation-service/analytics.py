@@ -0,0 +1,232 @@
+import datetime
+import json
+import os
+from typing import Any, Dict, List, Optional
+import numpy as np
+from anomaly_log import MonthlyAnomalyLog, incident_time
+
+TOP_N = 10
+COLUMNS_VERSION = 2 # of the .columns.npz and .analytics.json caches; older ones are rebuilt from the log
+
+class Column:
+    """A growable NumPy array; appends double the buffer when it is full."""
+
+    def __init__(self, dtype, values=None):
+        self._data = np.asarray(values if values is not None else [], dtype=dtype)
+        self.size = len(self._data)
+
+    def append(self, value):
+        if self.size == len(self._data):
+            grown = np.empty(max(1024, 2 * self.size), dtype=self._data.dtype)
+            grown[:self.size] = self._data
+            self._data = grown
+        self._data[self.size] = value
+        self.size += 1
+
+    @property
+    def values(self) -> np.ndarray:
+        return self._data[:self.size]
+
+class Labels:
+    """Dictionary encoding of a string column: each distinct value gets an integer code."""
+
+    def __init__(self, labels: Optional[List[str]] = None):
+        self.labels: List[str] = labels or []
+        self._codes = {label: code for code, label in enumerate(self.labels)}
+
+    def code(self, label: str) -> int:
+        code = self._codes.get(label)
+        if code is None:
+            code = self._codes[label] = len(self.labels)
+            self.labels.append(label)
+        return code
+
+class MonthColumns:
+    """
+    Columns for one month of anomalies, as dictionary-encoded NumPy arrays. The hour is
+    that of the incident (the event timestamp), or of receipt when the event has none;
+    -1 if neither parses. Policy violations are multi-valued, so they are kept
+    exploded: one (row, policy) pair per violated policy.
+    """
+
+    def __init__(self):
+        self.users = Labels()
+        self.event_types = Labels()
+        self.policies = Labels()
+        self.user = Column(np.int32)
+        self.event_type = Column(np.int32)
+        self.hour = Column(np.int8)
+        self.policy_row = Column(np.int64)
+        self.policy = Column(np.int32)
+
+    def __len__(self) -> int:
+        return self.user.size
+
+    def add(self, anomaly: dict):
+        event = anomaly.get("event", {})
+        row = len(self)
+        self.user.append(self.users.code(str(event.get("user_id", "N/A"))))
+        self.event_type.append(self.event_types.code(str(event.get("event_type", "N/A"))))
+        occurred = incident_time(anomaly)
+        if occurred is None:
+            try:
+                occurred = datetime.datetime.fromisoformat(anomaly.get("received_at", ""))
+            except ValueError:
+                pass
+        self.hour.append(occurred.hour if occurred else -1)
+        for policy_id in anomaly.get("violated_policies", []):
+            self.policy_row.append(row)
+            self.policy.append(self.policies.code(policy_id))
+
+    def save(self, path: str):
+        np.savez_compressed(
+            path,
+            version=COLUMNS_VERSION,
+            users=np.asarray(self.users.labels, dtype=str),
+            event_types=np.asarray(self.event_types.labels, dtype=str),
+            policies=np.asarray(self.policies.labels, dtype=str),
+            user=self.user.values,
+            event_type=self.event_type.values,
+            hour=self.hour.values,
+            policy_row=self.policy_row.values,
+            policy=self.policy.values,
+        )
+
+    @classmethod
+    def load(cls, path: str) -> Optional["MonthColumns"]:
+        """The saved columns, or None if the file has an older layout."""
+        columns = cls()
+        with np.load(path) as data:
+            if "version" not in data or int(data["version"]) != COLUMNS_VERSION:
+                return None
+            columns.users = Labels(data["users"].tolist())
+            columns.event_types = Labels(data["event_types"].tolist())
+            columns.policies = Labels(data["policies"].tolist())
+            columns.user = Column(np.int32, data["user"])
+            columns.event_type = Column(np.int32, data["event_type"])
+            columns.hour = Column(np.int8, data["hour"])
+            columns.policy_row = Column(np.int64, data["policy_row"])
+            columns.policy = Column(np.int32, data["policy"])
+        return columns
+
+def top_counts(codes: np.ndarray, labels: Labels, n: int = TOP_N) -> Dict[str, int]:
+    counts = np.bincount(codes, minlength=len(labels.labels))
+    order = np.argsort(-counts, kind="stable")[:n]
+    return {labels.labels[code]: int(counts[code]) for code in order if counts[code] > 0}
+
+def compute_analytics(columns: MonthColumns) -> Dict[str, Any]:
+    """Vectorised counts over one month of anomalies."""
+    hours = columns.hour.values
+    return {
+        "total": len(columns),
+        "by_event_type": top_counts(columns.event_type.values, columns.event_types, n=len(columns.event_types.labels)),
+        "top_users": top_counts(columns.user.values, columns.users),
+        "violations_per_policy": top_counts(columns.policy.values, columns.policies, n=len(columns.policies.labels)),
+        "hourly_histogram": np.bincount(hours[hours >= 0], minlength=24).tolist(),
+    }
+
+def previous_month(month: str) -> str:
+    first = datetime.datetime.strptime(f"{month}-01", "%Y-%m-%d")
+    return (first - datetime.timedelta(days=1)).strftime("%Y-%m")
+
+def month_over_month(current: Dict[str, Any], previous: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    previous_total = previous["total"] if previous else 0
+    delta = current["total"] - previous_total
+    previous_by_type = previous["by_event_type"] if previous else {}
+    return {
+        "previous_total": previous_total,
+        "total_delta": delta,
+        "total_delta_pct": round(100.0 * delta / previous_total, 1) if previous_total else None,
+        "by_event_type_delta": {
+            event_type: current["by_event_type"].get(event_type, 0) - previous_by_type.get(event_type, 0)
+            for event_type in sorted(set(current["by_event_type"]) | set(previous_by_type))
+        },
+    }
+
+class AnalyticsEngine:
+    """
+    Keeps anomalies in columnar form per month and computes DORA report figures with
+    NumPy. The current month's columns grow as anomalies arrive. Closed months are
+    frozen to `YYYY-MM.columns.npz`, and their figures cached in `YYYY-MM.analytics.json`,
+    so repeated report requests for them are instant. A late anomaly filed under a closed
+    month drops that month's caches, and they are rebuilt from the log on the next request.
+    """
+
+    def __init__(self, log: MonthlyAnomalyLog):
+        self.log = log
+        # Shared with the log so a lazy build from disk never races an append.
+        self._lock = log.lock
+        self._columns: Dict[str, MonthColumns] = {}
+        self._closed_results: Dict[str, Dict[str, Any]] = {}
+        log.listeners.append(self._on_append)
+
+    def _path(self, month: str, suffix: str) -> str:
+        return os.path.join(self.log.directory, f"{month}.{suffix}")
+
+    def _on_append(self, anomalies: List[dict], month: str):
+        if month < self.log.current_month():
+            self._closed_results.pop(month, None)
+            self._columns.pop(month, None)
+            for suffix in ("analytics.json", "columns.npz"):
+                if os.path.exists(self._path(month, suffix)):
+                    os.remove(self._path(month, suffix))
+            return
+        # Months not loaded yet will read these anomalies from the log when first used.
+        columns = self._columns.get(month)
+        if columns is not None:
+            for anomaly in anomalies:
+                columns.add(anomaly)
+
+    def _month_columns(self, month: str) -> MonthColumns:
+        columns = self._columns.get(month)
+        if columns is not None:
+            return columns
+        npz = self._path(month, "columns.npz")
+        columns = MonthColumns.load(npz) if os.path.exists(npz) else None
+        if columns is None:
+            columns = MonthColumns()
+            for anomaly in self.log.iter_month(month):
+                columns.add(anomaly)
+            if month < self.log.current_month() and len(columns):
+                columns.save(npz)
+        self._columns[month] = columns
+        return columns
+
+    def _month_analytics(self, month: str) -> Optional[Dict[str, Any]]:
+        closed = month < self.log.current_month()
+        if closed:
+            cached = self._closed_results.get(month)
+            if cached is not None:
+                return cached
+            cache_file = self._path(month, "analytics.json")
+            if os.path.exists(cache_file):
+                with open(cache_file, "r", encoding="utf-8") as f:
+                    cached = json.load(f)
+                if cached.get("version") == COLUMNS_VERSION:
+                    self._closed_results[month] = cached["figures"]
+                    return cached["figures"]
+
+        with self._lock:
+            columns = self._month_columns(month)
+            if not len(columns):
+                return None
+            result = compute_analytics(columns)
+
+        if closed:
+            with open(self._path(month, "analytics.json"), "w", encoding="utf-8") as f:
+                json.dump({"version": COLUMNS_VERSION, "figures": result}, f)
+            self._closed_results[month] = result
+            # Figures are cached, so the columns no longer need to stay in memory.
+            self._columns.pop(month, None)
+        return result
+
+    def analytics(self, month: str) -> Optional[Dict[str, Any]]:
+        """Figures for one month, including deltas against the previous month."""
+        current = self._month_analytics(month)
+        if current is None:
+            return None
+        return {
+            "month": month,
+            **current,
+            "month_over_month": month_over_month(current, self._month_analytics(previous_month(month))),
+        }
@@ -0,0 +1,108 @@
+import datetime
+import json
+import os
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+def incident_time(anomaly: dict) -> Optional[datetime.datetime]:
+    """
+    Local time of the anomaly's event, from its ISO 8601 timestamp or the extended JSON
+    date of an ingested document; None if it has none that parses.
+    """
+    value: Any = anomaly.get("event", {}).get("timestamp")
+    if isinstance(value, dict): # {"$date": ...} from the database integration service
+        value = value.get("$date")
+        if isinstance(value, dict):
+            value = value.get("$numberLong")
+        if isinstance(value, int) or (isinstance(value, str) and value.lstrip("-").isdigit()):
+            return datetime.datetime.fromtimestamp(int(value) / 1000)
+    if not isinstance(value, str) or not value:
+        return None
+    try:
+        occurred = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    return occurred.astimezone().replace(tzinfo=None) if occurred.tzinfo else occurred
+
+class MonthSummary:
+    """Running counts for one month, updated as each anomaly is stored."""
+
+    def __init__(self):
+        self.total = 0
+        self.by_event_type: Counter = Counter()
+        self.by_user: Counter = Counter()
+        self.by_policy: Counter = Counter()
+
+    def add(self, anomaly: dict):
+        event = anomaly.get("event", {})
+        self.total += 1
+        self.by_event_type[event.get("event_type", "N/A")] += 1
+        self.by_user[event.get("user_id", "N/A")] += 1
+        for policy_id in anomaly.get("violated_policies", []):
+            self.by_policy[policy_id] += 1
+
+class MonthlyAnomalyLog:
+    """
+    Anomalies persisted as one JSON-lines file per month (`YYYY-MM.jsonl`), chosen by the
+    caller; the service files each anomaly under the month its incident occurred.
+
+    Appends go straight to the current month's file and update that month's running
+    summary, so report summaries never rescan the log. Summaries of other months (or of
+    the current month after a restart) are rebuilt with one pass over the file on first use.
+    `listeners` are called with each appended batch while `lock` is held, so derived views
+    can build from the file under the same lock without double counting.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.lock = threading.RLock()
+        self.listeners: List[Callable[[List[dict], str], None]] = []
+        self._summaries: Dict[str, MonthSummary] = {}
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def current_month() -> str:
+        return datetime.datetime.now().strftime('%Y-%m')
+
+    def path_for(self, month: str) -> str:
+        return os.path.join(self.directory, f"{month}.jsonl")
+
+    def append(self, anomalies: Iterable[dict], month: Optional[str] = None):
+        month = month or self.current_month()
+        anomalies = list(anomalies)
+        lines = "".join(json.dumps(anomaly) + "\n" for anomaly in anomalies)
+        with self.lock:
+            summary = self._summary(month)
+            with open(self.path_for(month), "a", encoding="utf-8") as f:
+                f.write(lines)
+            for anomaly in anomalies:
+                summary.add(anomaly)
+            for listener in self.listeners:
+                listener(anomalies, month)
+
+    def iter_month(self, month: str) -> Iterator[dict]:
+        """Yields the month's anomalies one at a time, in arrival order."""
+        path = self.path_for(month)
+        if not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def summary(self, month: str) -> MonthSummary:
+        with self.lock:
+            return self._summary(month)
+
+    def _summary(self, month: str) -> MonthSummary:
+        summary = self._summaries.get(month)
+        if summary is None:
+            summary = MonthSummary()
+            for anomaly in self.iter_month(month):
+                summary.add(anomaly)
+            self._summaries[month] = summary
+        return summary
+
+    def months(self) -> List[str]:
+        return sorted(name[:-len(".jsonl")] for name in os.listdir(self.directory) if name.endswith(".jsonl"))
@@ -1,69 +1,176 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # services/, for the shared instrumentation and wire modules
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional
+from collections import Counter
+import asyncio
 import datetime
-import os
 import json
+from anomaly_log import MonthlyAnomalyLog, incident_time
+from analytics import AnalyticsEngine
+from instrumentation import instrument, metrics
+from wire import WireRoute, WireResponse
+
+ANOMALY_LOG_DIR = "anomalies"
+TOP_N = 10 # entries listed per summary breakdown
+PROFILING_ENABLED = False # exposes GET /debug/profile, a sampling profiler of the running process
 
-app = FastAPI()
+app = FastAPI(default_response_class=WireResponse)
+# Endpoints accept JSON or MessagePack bodies and answer in the format the client accepts.
+app.router.route_class = WireRoute
+instrument(app, "compliance", profiling=PROFILING_ENABLED)
+anomalies_received = metrics.counter("phalanx_anomalies_received_total", "Anomalies stored for the monthly report.")
 
-# In-memory storage for anomalies for the current month
-monthly_anomalies: List[Dict[str, Any]] = []
+# Month-partitioned on-disk storage for received anomalies
+anomaly_log = MonthlyAnomalyLog(ANOMALY_LOG_DIR)
+analytics = AnalyticsEngine(anomaly_log)
 
 class Anomaly(BaseModel):
     event: Dict[str, Any]
     reason: str
+    violated_policies: List[str] = []
+    trace_id: Optional[str] = None # of the request that ingested the event, for tracing it across services
 
-@app.post("/report_anomaly")
-async def report_anomaly(anomaly: Anomaly):
-    """
-    Receives an anomaly and stores it for the monthly report.
-    """
-    monthly_anomalies.append(anomaly.dict())
-    return {"message": "Anomaly received and stored for monthly report."}
+class AnomalyBatch(BaseModel):
+    anomalies: List[Anomaly]
 
-@app.post("/generate_monthly_report")
-async def generate_monthly_report():
+# --- Report Rendering ---
+def format_counts(counts: Counter) -> str:
+    return ", ".join(f"{key}: {count}" for key, count in counts.most_common(TOP_N)) or "N/A"
+
+def format_ranking(counts: Dict[str, int]) -> str:
+    return ", ".join(f"{key} ({count})" for key, count in list(counts.items())[:TOP_N]) or "none"
+
+def render_problems(month: str) -> str:
+    figures = analytics.analytics(month)
+    if figures is None:
+        return "    - No anomalies recorded.\n"
+
+    histogram = figures["hourly_histogram"]
+    busiest_hours = sorted(range(24), key=lambda hour: histogram[hour], reverse=True)[:3]
+    mom = figures["month_over_month"]
+    change = f"{mom['total_delta']:+d}"
+    if mom["total_delta_pct"] is not None:
+        change += f", {mom['total_delta_pct']:+.1f}%"
+
+    return (
+        f"    - Top offending users: {format_ranking(figures['top_users'])}.\n"
+        f"    - Violations per policy: {format_ranking(figures['violations_per_policy'])}.\n"
+        f"    - Busiest hours: {', '.join(f'{hour:02d}:00 ({histogram[hour]})' for hour in busiest_hours if histogram[hour]) or 'none'}.\n"
+        f"    - Hourly incidents (00-23): {' '.join(str(count) for count in histogram)}\n"
+        f"    - Month over month: {figures['total']} anomalies vs {mom['previous_total']} in the previous month ({change}).\n"
+    )
+
+def render_report(month: str) -> Iterator[str]:
     """
-    Generates a single monthly DORA compliance report from all collected anomalies.
+    Yields the monthly report in chunks. The summary comes from the month's running
+    counts and the anomaly listing streams from disk, so memory use stays constant.
     """
-    if not monthly_anomalies:
-        raise HTTPException(status_code=404, detail="No anomalies recorded for the current month.")
+    summary = anomaly_log.summary(month)
 
-    report_date = datetime.datetime.now().strftime('%Y-%m')
-    report_filename = f"dora_monthly_report_{report_date}.txt"
-
-    report_content = f"""
-    DORA Monthly Compliance Report - {report_date}
+    yield f"""
+    DORA Monthly Compliance Report - {month}
     -------------------------------------------
 
     Summary of Anomalies:
 
-    """
+    Total anomalies: {summary.total}
+    By event type: {format_counts(summary.by_event_type)}
+    By policy: {format_counts(summary.by_policy)}
+    Top users: {format_counts(summary.by_user)}
 
-    for i, anomaly in enumerate(monthly_anomalies):
-        report_content += f"Anomaly {i + 1}:\n"
-        report_content += f"  Event Type: {anomaly['event'].get('event_type', 'N/A')}\n"
-        report_content += f"  User ID: {anomaly['event'].get('user_id', 'N/A')}\n"
-        report_content += f"  Timestamp: {anomaly['event'].get('timestamp', 'N/A')}\n"
-        report_content += f"  Reason: {anomaly['reason']}\n"
-        report_content += f"  Event Data: {json.dumps(anomaly['event'].get('data', {}), indent=2)}\n\n"
+"""
 
-    report_content += f"""
-    Main Problems Identified:
-    - High volume of suspicious transactions to offshore accounts.
-    - Loan applications with unusually low credit scores.
+    for i, anomaly in enumerate(anomaly_log.iter_month(month)):
+        trace = f"  Trace ID: {anomaly['trace_id']}\n" if anomaly.get("trace_id") else ""
+        yield (
+            f"Anomaly {i + 1}:\n"
+            f"  Event Type: {anomaly['event'].get('event_type', 'N/A')}\n"
+            f"  User ID: {anomaly['event'].get('user_id', 'N/A')}\n"
+            f"  Timestamp: {anomaly['event'].get('timestamp', 'N/A')}\n"
+            f"  Reason: {anomaly['reason']}\n"
+            f"{trace}"
+            f"  Event Data: {json.dumps(anomaly['event'].get('data', {}), indent=2)}\n\n"
+        )
 
+    yield f"""
+    Main Problems Identified:
+{render_problems(month)}
     Suggestions for Remediation:
     - Implement stricter controls for international transactions, especially to high-risk countries.
     - Enhance fraud detection models for loan applications to include more comprehensive credit risk assessment.
     - Conduct regular security audits and employee training on data handling and anomaly detection.
     """
 
-    with open(report_filename, "w") as f:
-        f.write(report_content)
+def write_report(month: str, report_filename: str):
+    tmp_filename = f"{report_filename}.tmp"
+    with metrics.stage("write_report"), open(tmp_filename, "w") as f:
+        f.writelines(render_report(month))
+    os.replace(tmp_filename, report_filename)
+
+def store_anomalies(anomalies: List[Anomaly]):
+    """Files each anomaly under the month of its incident, so late or replayed ones still count there."""
+    received_at = datetime.datetime.now()
+    by_month: Dict[str, List[dict]] = {}
+    for anomaly in anomalies:
+        record = {**anomaly.dict(), "received_at": received_at.isoformat()}
+        occurred = incident_time(record) or received_at
+        by_month.setdefault(occurred.strftime('%Y-%m'), []).append(record)
+    with metrics.stage("store_anomalies"):
+        for month, records in by_month.items():
+            anomaly_log.append(records, month)
+    anomalies_received.inc(amount=len(anomalies))
+
+# --- API Endpoints ---
+@app.post("/report_anomaly")
+async def report_anomaly(anomaly: Anomaly):
+    """
+    Receives an anomaly and stores it for the monthly report.
+    """
+    await asyncio.to_thread(store_anomalies, [anomaly])
+    return {"message": "Anomaly received and stored for monthly report."}
+
+@app.post("/report_anomalies")
+async def report_anomalies(batch: AnomalyBatch):
+    """
+    Receives a batch of anomalies and stores them for the monthly report.
+    """
+    await asyncio.to_thread(store_anomalies, batch.anomalies)
+    return {"message": f"{len(batch.anomalies)} anomalies received and stored for monthly report."}
 
-    # Clear anomalies after generating the report
-    monthly_anomalies.clear()
+@app.post("/generate_monthly_report")
+async def generate_monthly_report():
+    """
+    Generates a single monthly DORA compliance report from all anomalies received this month.
+    """
+    report_date = anomaly_log.current_month()
+    if not (await asyncio.to_thread(anomaly_log.summary, report_date)).total:
+        raise HTTPException(status_code=404, detail="No anomalies recorded for the current month.")
+
+    report_filename = f"dora_monthly_report_{report_date}.txt"
+    await asyncio.to_thread(write_report, report_date, report_filename)
 
     return {"message": f"Monthly DORA report generated successfully: {report_filename}"}
+
+@app.get("/reports/{month}")
+async def stream_monthly_report(month: str):
+    """
+    Streams the DORA report for a month (YYYY-MM) without writing it to disk.
+    """
+    if month not in await asyncio.to_thread(anomaly_log.months):
+        raise HTTPException(status_code=404, detail=f"No anomalies recorded for {month}.")
+    return StreamingResponse(render_report(month), media_type="text/plain")
+
+@app.get("/analytics/{month}")
+async def get_month_analytics(month: str):
+    """
+    Report figures for a month (YYYY-MM): top users, violations per policy, hourly
+    incident histogram and month-over-month deltas.
+    """
+    if month not in await asyncio.to_thread(anomaly_log.months):
+        raise HTTPException(status_code=404, detail=f"No anomalies recorded for {month}.")
+    with metrics.stage("analytics"):
+        return await asyncio.to_thread(analytics.analytics, month)
@@ -0,0 +1,104 @@
+import os
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from bson import json_util
+
+class CheckpointStore:
+    """
+    Persists per-collection high-water marks in a local JSON file so incremental
+    ingestion can pick up where the last run (or a crashed run) stopped.
+
+    A mark is the cursor field value and `_id` of the last forwarded document. Values are
+    stored as MongoDB extended JSON so ObjectIds and datetimes round-trip exactly.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._marks: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self._marks = json_util.loads(f.read())
+
+    @staticmethod
+    def key_for(host: str, port: int, dbname: str, collection_name: str, cursor_field: str) -> str:
+        return f"{host}:{port}/{dbname}/{collection_name}#{cursor_field}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._marks.get(key)
+
+    def set(self, key: str, mark: Dict[str, Any]):
+        with self._lock:
+            self._marks[key] = mark
+            self._save()
+
+    def reset(self, key: str) -> bool:
+        with self._lock:
+            if self._marks.pop(key, None) is None:
+                return False
+            self._save()
+            return True
+
+    def _save(self):
+        # Written to a temp file and renamed so a crash never leaves a torn checkpoint.
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json_util.dumps(self._marks, indent=2))
+        os.replace(tmp_path, self.path)
+
+class CheckpointTracker:
+    """
+    Advances a checkpoint as batches are delivered. Batches can finish out of order when
+    the forwarder runs several requests at once, so the mark only moves over the
+    contiguous prefix of delivered batches; a crash never skips a batch still in flight.
+    A dead-lettered batch holds the mark before it for the rest of the run, so the next
+    incremental run reads it again.
+    """
+
+    def __init__(self, store: CheckpointStore, key: str):
+        self.store = store
+        self.key = key
+        self.blocked = False # set once a batch was dead-lettered
+        self._pending = deque()
+
+    def track(self, mark: Dict[str, Any]) -> Callable[[bool], None]:
+        """Registers the next batch's mark and returns the callback to run on completion."""
+        entry = [mark, None]
+        self._pending.append(entry)
+
+        def done(delivered: bool):
+            entry[1] = delivered
+            if not delivered:
+                self.blocked = True
+            self._advance()
+        return done
+
+    def _advance(self):
+        last = None
+        while self._pending and self._pending[0][1]:
+            last = self._pending.popleft()[0]
+        if last is not None:
+            self.store.set(self.key, last)
+
+def incremental_query(cursor_field: str, mark: Optional[Dict[str, Any]]) -> Tuple[Dict[str, Any], List[Tuple[str, int]]]:
+    """
+    Builds the filter and sort for reading documents after `mark`. Ties on a non-unique
+    cursor field are broken by `_id` so no document is skipped at a batch boundary.
+    """
+    if cursor_field == "_id":
+        sort = [("_id", 1)]
+        query = {"_id": {"$gt": mark["_id"]}} if mark else {}
+        return query, sort
+
+    sort = [(cursor_field, 1), ("_id", 1)]
+    if not mark:
+        return {}, sort
+    query = {"$or": [
+        {cursor_field: {"$gt": mark["value"]}},
+        {cursor_field: mark["value"], "_id": {"$gt": mark["_id"]}},
+    ]}
+    return query, sort
+
+def mark_for(doc: Dict[str, Any], cursor_field: str) -> Dict[str, Any]:
+    return {"value": doc.get(cursor_field), "_id": doc["_id"]}
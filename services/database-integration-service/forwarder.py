@@ -0,0 +1,172 @@
+import asyncio
+import datetime
+import logging
+import random
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import httpx
+from instrumentation import metrics, current_trace_id, trace_headers
+import wire
+
+class ForwardingTicket:
+    """Tracks the events one ingestion job has handed to the forwarder."""
+
+    def __init__(self, on_result: Optional[Callable[[int, int], None]] = None, trace_id: Optional[str] = None):
+        self.on_result = on_result
+        self.trace_id = trace_id or current_trace_id() # sent with every request made for this job
+        self.pending = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def _submitted(self):
+        self.pending += 1
+        self._idle.clear()
+
+    def _finished(self, sent: int, failed: int):
+        self.pending -= 1
+        if self.on_result:
+            self.on_result(sent, failed)
+        if self.pending == 0:
+            self._idle.set()
+
+    async def wait(self):
+        """Waits until every submitted event has been delivered or dead-lettered."""
+        await self._idle.wait()
+
+class EventForwarder:
+    """
+    Forwards events to the anomaly detection service through a bounded queue drained by
+    `concurrency` workers sharing one keep-alive connection pool.
+
+    `submit` blocks while the queue is full, which applies backpressure to the reader.
+    Failed requests are retried with jittered exponential backoff; events that still fail
+    are appended to `dead_letter_file`. With `use_batch_endpoint` each submitted batch is
+    sent to /check-events in one request, otherwise every event goes to /check-event.
+    Requests carry the ticket's trace id, so the detector's anomalies can be traced back
+    to the ingestion job. Bodies are encoded in `wire_format` (MessagePack by default
+    when installed); if the detector answers 415 the forwarder switches to JSON.
+    """
+
+    def __init__(self, base_url: str, concurrency: int = 8, queue_size: int = 64, max_retries: int = 3,
+                 backoff_base: float = 0.2, backoff_max: float = 5.0,
+                 dead_letter_file: str = "dead_letter.jsonl", use_batch_endpoint: bool = True,
+                 wire_format: Optional[str] = None):
+        self.base_url = base_url
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.dead_letter_file = dead_letter_file
+        self.use_batch_endpoint = use_batch_endpoint
+        self.wire_format = wire_format or (wire.MSGPACK if wire.msgpack else wire.JSON)
+        self._queue: Optional[asyncio.Queue] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._workers: List[asyncio.Task] = []
+        self._dead_letter_lock = asyncio.Lock()
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        self._client = httpx.AsyncClient(base_url=self.base_url, limits=limits, timeout=60.0)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._client:
+            await self._client.aclose()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def submit(self, ticket: ForwardingTicket, events: List[Dict[str, Any]],
+                     on_complete: Optional[Callable[[bool], None]] = None):
+        """
+        Queues a batch of events. `on_complete` is called once every event in the batch
+        has been delivered or dead-lettered, with True only if all were delivered.
+        """
+        if self.use_batch_endpoint:
+            items = [events]
+        else:
+            items = [[event] for event in events]
+        remaining = [len(items)]
+        delivered = [True]
+
+        def item_done(ok: bool):
+            remaining[0] -= 1
+            delivered[0] = delivered[0] and ok
+            if remaining[0] == 0 and on_complete:
+                on_complete(delivered[0])
+
+        for item in items:
+            ticket._submitted()
+            await self._queue.put((ticket, item, item_done))
+
+    async def _worker(self):
+        while True:
+            ticket, events, item_done = await self._queue.get()
+            ok = False
+            try:
+                error = await self._send_with_retry(events, ticket.trace_id)
+                if error is None:
+                    ok = True
+                    ticket._finished(len(events), 0)
+                else:
+                    await self._dead_letter(events, error)
+                    ticket._finished(0, len(events))
+            except Exception as e:
+                logging.error(f"Forwarder worker failed: {e}")
+                ticket._finished(0, len(events))
+            finally:
+                item_done(ok)
+                self._queue.task_done()
+
+    def _request(self, events: List[Dict[str, Any]]) -> Tuple[str, Any]:
+        if self.use_batch_endpoint:
+            return "/check-events", {"events": events}
+        return "/check-event", events[0]
+
+    async def _send_with_retry(self, events: List[Dict[str, Any]], trace_id: Optional[str] = None) -> Optional[str]:
+        """Returns None on success, or the last error once retries are exhausted."""
+        path, payload = self._request(events)
+        for attempt in range(self.max_retries + 1):
+            try:
+                with metrics.stage("forward_request"):
+                    response = await self._post(path, payload, trace_id)
+                if response.status_code < 500 and response.status_code != 429:
+                    response.raise_for_status()
+                    return None
+                error = f"HTTP {response.status_code}"
+            except httpx.HTTPStatusError as exc:
+                # Client errors will not succeed on retry.
+                return f"HTTP {exc.response.status_code}"
+            except httpx.HTTPError as exc:
+                error = f"{type(exc).__name__}: {exc}"
+            if attempt < self.max_retries:
+                delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+                await asyncio.sleep(random.uniform(0, delay))
+        return error
+
+    async def _post(self, path: str, payload: Any, trace_id: Optional[str]) -> httpx.Response:
+        fmt = self.wire_format
+        headers = {"Content-Type": fmt, "Accept": fmt, **trace_headers(trace_id)}
+        response = await self._client.post(path, content=wire.encode(payload, fmt), headers=headers)
+        if response.status_code == 415 and fmt != wire.JSON:
+            logging.warning(f"Detector does not accept {fmt}; forwarding as JSON from now on.")
+            self.wire_format = wire.JSON
+            return await self._post(path, payload, trace_id)
+        return response
+
+    async def _dead_letter(self, events: List[Dict[str, Any]], error: str):
+        record = {"failed_at": datetime.datetime.now().isoformat(), "error": error, "events": events}
+        line = wire.dumps(record).decode() + "\n"
+        async with self._dead_letter_lock:
+            await asyncio.to_thread(self._append_line, line)
+        logging.warning(f"Dead-lettered {len(events)} events: {error}")
+
+    def _append_line(self, line: str):
+        with open(self.dead_letter_file, "a", encoding="utf-8") as f:
+            f.write(line)
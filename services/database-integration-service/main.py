@@ -1,14 +1,45 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # services/, for the shared instrumentation and wire modules
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure
-from typing import Optional, Dict, Any
-import httpx
+from typing import Optional, Dict, Any, List, Tuple
 import asyncio
 from bson import json_util
-import json
+import datetime
+import itertools
+import uuid
+from forwarder import EventForwarder, ForwardingTicket
+from checkpoints import CheckpointStore, CheckpointTracker, incremental_query, mark_for
+from instrumentation import instrument, metrics, current_trace_id
+import wire
+
+# --- Configuration ---
+ANOMALY_DETECTION_URL = "http://localhost:8000"
+FORWARD_CONCURRENCY = 8 # concurrent in-flight requests to the detector
+FORWARD_QUEUE_SIZE = 64 # queued batches before ingestion is paused
+FORWARD_MAX_RETRIES = 3
+FORWARD_USE_BATCH_ENDPOINT = True # send batches to /check-events instead of single events to /check-event
+FORWARD_WIRE_FORMAT = None # "application/json" or "application/msgpack"; default MessagePack when installed
+DEAD_LETTER_FILE = "dead_letter.jsonl"
+CHECKPOINT_FILE = "checkpoints.json"
+PROFILING_ENABLED = False # exposes GET /debug/profile, a sampling profiler of the running process
 
 app = FastAPI()
+instrument(app, "database-integration", profiling=PROFILING_ENABLED)
+
+forwarder = EventForwarder(
+    ANOMALY_DETECTION_URL,
+    concurrency=FORWARD_CONCURRENCY,
+    queue_size=FORWARD_QUEUE_SIZE,
+    max_retries=FORWARD_MAX_RETRIES,
+    dead_letter_file=DEAD_LETTER_FILE,
+    use_batch_endpoint=FORWARD_USE_BATCH_ENDPOINT,
+    wire_format=FORWARD_WIRE_FORMAT,
+)
+checkpoints = CheckpointStore(CHECKPOINT_FILE)
 
 class DBConnection(BaseModel):
     db_type: str
@@ -18,57 +49,177 @@ class DBConnection(BaseModel):
     password: Optional[str] = None
     dbname: str
     collection_name: str
+    batch_size: int = 500
+    projection: Optional[List[str]] = None # fields to fetch; user_id and timestamp are always included
+    mode: str = "full" # "full" re-reads the collection, "incremental" resumes after the last checkpoint
+    cursor_field: str = "_id" # monotonic field for incremental mode, e.g. "_id" or "updated_at"
+
+class IngestionJob(BaseModel):
+    job_id: str
+    collection_name: str
+    mode: str = "full"
+    status: str = "pending" # pending, running, completed, failed
+    total_documents: Optional[int] = None
+    documents_processed: int = 0
+    events_forwarded: int = 0
+    events_dead_lettered: int = 0
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    error: Optional[str] = None
+    trace_id: Optional[str] = None # carried to the detector and on to the compliance service
+
+# --- In-Memory Job Registry ---
+jobs: Dict[str, IngestionJob] = {}
+job_tasks: Dict[str, asyncio.Task] = {}
+
+# --- Metrics ---
+documents_read = metrics.counter("phalanx_documents_read_total", "Documents read from source collections.", ["collection"])
+events_forwarded = metrics.counter("phalanx_events_forwarded_total", "Events delivered to or dead-lettered by the forwarder.", ["result"])
+metrics.gauge("phalanx_queue_depth", "Items waiting in an in-process queue.", lambda: {"forwarder": forwarder.queue_depth}, label="queue")
+metrics.gauge("phalanx_ingestion_jobs_running", "Ingestion jobs in progress.", lambda: len(job_tasks))
+
+# --- Helper Functions ---
+def mongo_uri(db_connection: DBConnection) -> str:
+    if db_connection.user and db_connection.password:
+        return f"mongodb://{db_connection.user}:{db_connection.password}@{db_connection.host}:{db_connection.port}/"
+    return f"mongodb://{db_connection.host}:{db_connection.port}/"
+
+def build_projection(fields: Optional[List[str]], cursor_field: str) -> Optional[Dict[str, int]]:
+    if not fields:
+        return None
+    return {field: 1 for field in {*fields, "user_id", "timestamp", cursor_field}}
+
+def read_batch(cursor, batch_size: int, cursor_field: str) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """
+    Pulls the next batch from the cursor and converts it from BSON to JSON-safe types
+    (extended JSON, as produced by json_util). Also returns the high-water mark of the
+    batch, taken from the raw BSON values.
+    """
+    documents = list(itertools.islice(cursor, batch_size))
+    if not documents:
+        return [], None
+    return wire.loads(wire.dumps(documents, default=json_util.default)), mark_for(documents[-1], cursor_field)
+
+def checkpoint_key(db_connection: DBConnection) -> str:
+    return CheckpointStore.key_for(db_connection.host, db_connection.port, db_connection.dbname,
+                                   db_connection.collection_name, db_connection.cursor_field)
+
+def document_to_event(doc: Dict[str, Any], collection_name: str) -> Dict[str, Any]:
+    return {
+        "user_id": doc.get("user_id", "unknown"),
+        "timestamp": doc.get("timestamp", ""),
+        "event_type": collection_name,
+        "data": doc
+    }
+
+async def run_ingestion(job: IngestionJob, client: MongoClient, db_connection: DBConnection):
+    """
+    Streams the collection in batches of `batch_size` and hands each batch to the
+    forwarder as soon as it is converted. Reading pauses while the forwarder's queue is
+    full, so memory stays bounded by the queue size.
+    """
+    def record_result(sent: int, failed: int):
+        job.events_forwarded += sent
+        job.events_dead_lettered += failed
+        events_forwarded.inc("delivered", amount=sent)
+        events_forwarded.inc("dead_lettered", amount=failed)
+
+    ticket = ForwardingTicket(on_result=record_result, trace_id=job.trace_id)
+    job.status = "running"
+    job.started_at = datetime.datetime.now().isoformat()
+    try:
+        collection = client[db_connection.dbname][db_connection.collection_name]
+        projection = build_projection(db_connection.projection, db_connection.cursor_field)
+        tracker = None
+        if db_connection.mode == "incremental":
+            key = checkpoint_key(db_connection)
+            query, sort = incremental_query(db_connection.cursor_field, checkpoints.get(key))
+            tracker = CheckpointTracker(checkpoints, key)
+            job.total_documents = await asyncio.to_thread(collection.count_documents, query)
+            cursor = collection.find(query, projection, sort=sort, batch_size=db_connection.batch_size)
+        else:
+            job.total_documents = await asyncio.to_thread(collection.estimated_document_count)
+            cursor = collection.find({}, projection, batch_size=db_connection.batch_size)
+
+        while True:
+            with metrics.stage("read_batch"):
+                documents, mark = await asyncio.to_thread(read_batch, cursor, db_connection.batch_size, db_connection.cursor_field)
+            if not documents:
+                break
+            documents_read.inc(db_connection.collection_name, amount=len(documents))
+            events = [document_to_event(doc, db_connection.collection_name) for doc in documents]
+            await forwarder.submit(ticket, events, on_complete=tracker.track(mark) if tracker else None)
+            job.documents_processed += len(documents)
+
+        await ticket.wait()
+        if tracker and tracker.blocked:
+            job.error = "Some batches were dead-lettered; the checkpoint stays before the first of them."
+        job.status = "completed"
+    except Exception as e:
+        job.status = "failed"
+        job.error = str(e)
+    finally:
+        job.finished_at = datetime.datetime.now().isoformat()
+        client.close()
+        job_tasks.pop(job.job_id, None)
+
+# --- API Endpoints ---
+@app.on_event("startup")
+async def startup_event():
+    await forwarder.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await forwarder.stop()
 
 @app.post("/connect")
 async def connect_to_db(db_connection: DBConnection):
     """
-    Connects to a MongoDB database, fetches data from a specified collection,
-    and sends each document as an event to the anomaly detection service.
+    Connects to a MongoDB database and starts a background job that streams the
+    specified collection to the anomaly detection service. Returns the job id right away;
+    progress is reported by GET /jobs/{job_id}.
     """
     if db_connection.db_type != "mongodb":
         raise HTTPException(status_code=400, detail="Only MongoDB is supported at the moment.")
+    if db_connection.batch_size < 1:
+        raise HTTPException(status_code=400, detail="batch_size must be at least 1.")
+    if db_connection.mode not in ("full", "incremental"):
+        raise HTTPException(status_code=400, detail="mode must be 'full' or 'incremental'.")
 
     try:
-        # Construct MongoDB connection string
-        if db_connection.user and db_connection.password:
-            mongo_uri = f"mongodb://{db_connection.user}:{db_connection.password}@{db_connection.host}:{db_connection.port}/"
-        else:
-            mongo_uri = f"mongodb://{db_connection.host}:{db_connection.port}/"
-
-        client = MongoClient(mongo_uri, serverSelectionTimeoutMS=5000)
+        client = MongoClient(mongo_uri(db_connection), serverSelectionTimeoutMS=5000)
         # Check if the server is available
-        client.admin.command('ping')
-
-        db = client[db_connection.dbname]
-        collection = db[db_connection.collection_name]
-
-        # Fetch data from the collection and serialize using bson.json_util
-        documents = json.loads(json_util.dumps(collection.find()))
-
-        if not documents:
-            return {"message": f"No documents found in collection {db_connection.collection_name}."}
-
-        # Send each document as an event to the anomaly detection service
-        async with httpx.AsyncClient() as http_client:
-            for doc in documents:
-                event_data = {
-                    "user_id": doc.get("user_id", "unknown"),
-                    "timestamp": doc.get("timestamp", ""),
-                    "event_type": db_connection.collection_name,
-                    "data": doc
-                }
-                try:
-                    response = await http_client.post("http://localhost:8000/check-event", json=event_data)
-                    response.raise_for_status()
-                    print(f"Sent event to anomaly detection: {event_data}")
-                except httpx.RequestError as exc:
-                    print(f"Error sending event to anomaly detection: {exc.request.url!r} - {exc}")
-                except Exception as e:
-                    print(f"Unexpected error sending event: {e}")
-
-        return {"message": f"Successfully connected to MongoDB and processed {len(documents)} documents from {db_connection.collection_name}."}
-
+        await asyncio.to_thread(client.admin.command, 'ping')
     except ConnectionFailure as e:
         raise HTTPException(status_code=500, detail=f"Failed to connect to MongoDB: {e}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to connect or process data: {e}")
+
+    job = IngestionJob(job_id=uuid.uuid4().hex, collection_name=db_connection.collection_name, mode=db_connection.mode,
+                       trace_id=current_trace_id())
+    jobs[job.job_id] = job
+    job_tasks[job.job_id] = asyncio.create_task(run_ingestion(job, client, db_connection))
+
+    return {
+        "message": f"Successfully connected to MongoDB. Ingestion job {job.job_id} started for {db_connection.collection_name}.",
+        "job_id": job.job_id,
+        "trace_id": job.trace_id
+    }
+
+@app.get("/jobs", response_model=List[IngestionJob])
+async def list_jobs():
+    return list(jobs.values())
+
+@app.get("/jobs/{job_id}", response_model=IngestionJob)
+async def get_job(job_id: str):
+    """Reports the progress of an ingestion job."""
+    if job_id not in jobs:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return jobs[job_id]
+
+@app.delete("/checkpoints", status_code=204)
+async def reset_checkpoint(db_connection: DBConnection):
+    """Forgets the incremental checkpoint for a collection so the next run starts from scratch."""
+    if not checkpoints.reset(checkpoint_key(db_connection)):
+        raise HTTPException(status_code=404, detail="Checkpoint not found.")
+    return
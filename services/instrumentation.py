@@ -0,0 +1,263 @@
+"""
+Shared instrumentation for the Phalanx services: counters, gauges and timing histograms
+exposed in the Prometheus text format on /metrics, a trace id carried across service
+calls in the X-Trace-Id header, and an opt-in sampling profiler.
+
+Only the standard library is used, so every service can import it without new
+dependencies. The services add this directory to sys.path before importing it.
+"""
+import asyncio
+import bisect
+import contextlib
+import contextvars
+import sys
+import threading
+import time
+import traceback
+import uuid
+from collections import Counter as FrameCounter
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from fastapi import FastAPI, Query, Response
+
+TRACE_HEADER = "X-Trace-Id"
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# --- Trace Context ---
+_trace_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("trace_id", default=None)
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+def current_trace_id() -> Optional[str]:
+    return _trace_id.get()
+
+def set_trace_id(trace_id: Optional[str]):
+    """Makes `trace_id` current for this task and the tasks and threads it starts."""
+    _trace_id.set(trace_id)
+
+def trace_headers(trace_id: Optional[str] = None) -> Dict[str, str]:
+    """Headers that carry the given (by default the current) trace id to another service."""
+    trace_id = trace_id or current_trace_id()
+    return {TRACE_HEADER: trace_id} if trace_id else {}
+
+# --- Metrics ---
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1.0):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self, const: Tuple[Tuple[str, str], ...]) -> List[str]:
+        names = [name for name, _ in const] + list(self.labels)
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = list(self._values.items())
+        for label_values, value in items:
+            lines.append(f"{self.name}{_format_labels(names, [v for _, v in const] + list(label_values))} {value}")
+        return lines
+
+class Gauge:
+    """
+    A value read when /metrics is scraped. `read` returns a number, or for a labelled
+    gauge a dict from label value to number (e.g. queue name to depth).
+    """
+
+    def __init__(self, name: str, help: str, read: Callable[[], object], label: Optional[str] = None):
+        self.name = name
+        self.help = help
+        self.read = read
+        self.label = label
+
+    def render(self, const: Tuple[Tuple[str, str], ...]) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        names = [name for name, _ in const]
+        values = [value for _, value in const]
+        try:
+            reading = self.read()
+        except Exception:
+            return lines
+        if self.label is None:
+            lines.append(f"{self.name}{_format_labels(names, values)} {float(reading)}")
+        else:
+            for label_value, value in reading.items():
+                lines.append(f"{self.name}{_format_labels(names + [self.label], values + [label_value])} {float(value)}")
+        return lines
+
+class Histogram:
+    """Cumulative-bucket histogram of durations in seconds, one series per label combination."""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[str, ...], List[float]] = {} # bucket counts..., +Inf count, sum
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0.0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self, const: Tuple[Tuple[str, str], ...]) -> List[str]:
+        names = [name for name, _ in const] + list(self.labels) + ["le"]
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(label_values, list(series)) for label_values, series in self._series.items()]
+        for label_values, series in items:
+            values = [v for _, v in const] + list(label_values)
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(names, values + [bound])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(names[:-1], values)} {series[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(names[:-1], values)} {cumulative}")
+        return lines
+
+class Metrics:
+    """
+    The metrics of one service process. Every series carries a `service` label. Per-stage
+    timings share one histogram, `phalanx_stage_seconds{stage=...}`, so a request's time
+    can be broken down across encode, vector search, policy evaluation and so on.
+    """
+
+    def __init__(self):
+        self.const: Tuple[Tuple[str, str], ...] = ()
+        self._metrics: Dict[str, object] = {}
+        self.stages = self.histogram("phalanx_stage_seconds", "Time spent in one processing stage.", ["stage"])
+        self.requests = self.histogram(
+            "phalanx_http_request_seconds", "HTTP request latency by route.", ["method", "route", "status"]
+        )
+
+    def set_service(self, service: str):
+        self.const = (("service", service),)
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered.")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name: str, help: str, read: Callable[[], object], label: Optional[str] = None) -> Gauge:
+        return self._register(Gauge(name, help, read, label))
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        """Times the enclosed block as one `phalanx_stage_seconds` observation."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.observe(time.perf_counter() - start, name)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render(self.const))
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+# --- Sampling Profiler ---
+def sample_stacks(seconds: float, interval: float = 0.005, max_depth: int = 64) -> str:
+    """
+    Samples the Python stacks of every thread in the process (the event loop and the
+    to_thread workers) every `interval` seconds for `seconds`, and returns them in the
+    collapsed format read by flamegraph.pl and speedscope: one "frame;frame;... count"
+    line per distinct stack. The sampling thread itself is left out.
+    """
+    stacks: FrameCounter = FrameCounter()
+    own_thread = threading.get_ident()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread:
+                continue
+            frames = traceback.extract_stack(frame, limit=max_depth)
+            stacks[";".join(f"{f.name} ({f.filename.rsplit('/', 1)[-1]}:{f.lineno})" for f in frames)] += 1
+        time.sleep(interval)
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+# --- FastAPI Integration ---
+class InstrumentationMiddleware:
+    """
+    ASGI middleware that times every HTTP request by route template and status, and makes
+    the request's trace id current: the caller's X-Trace-Id if it sent one, otherwise a
+    new one. The trace id is echoed in the response headers.
+    """
+
+    def __init__(self, app, registry: Metrics):
+        self.app = app
+        self.registry = registry
+        self._header = TRACE_HEADER.lower().encode()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        trace_id = None
+        for name, value in scope["headers"]:
+            if name == self._header:
+                trace_id = value.decode("latin-1")[:64]
+                break
+        trace_id = trace_id or new_trace_id()
+        token = _trace_id.set(trace_id)
+        status = [500]
+
+        async def send_with_trace(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(self._header, trace_id.encode("latin-1"))]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_trace)
+        finally:
+            route = scope.get("route")
+            self.registry.requests.observe(
+                time.perf_counter() - start, scope["method"], getattr(route, "path", "unmatched"), str(status[0])
+            )
+            _trace_id.reset(token)
+
+def instrument(app: FastAPI, service: str, profiling: bool = False, registry: Metrics = metrics):
+    """
+    Adds request timing and trace propagation to `app`, and the GET /metrics endpoint.
+    With `profiling`, GET /debug/profile?seconds=N also samples the process's stacks
+    for N seconds and returns them collapsed, to profile hot requests under live load.
+    """
+    registry.set_service(service)
+    app.add_middleware(InstrumentationMiddleware, registry=registry)
+
+    @app.get("/metrics", include_in_schema=False)
+    async def get_metrics():
+        return Response(registry.render(), media_type="text/plain; version=0.0.4")
+
+    if profiling:
+        @app.get("/debug/profile", include_in_schema=False)
+        async def get_profile(seconds: float = Query(10.0, gt=0, le=120), interval: float = Query(0.005, gt=0)):
+            return Response(await asyncio.to_thread(sample_stacks, seconds, interval), media_type="text/plain")
@@ -1,13 +1,25 @@
-
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List, Dict, Any
-import json
 import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # services/, for the shared instrumentation module
+from fastapi import FastAPI, HTTPException, Header, Response
+from pydantic import BaseModel, ValidationError
+from typing import List, Dict, Any, Optional
+import asyncio
+import json
+import re
+import uuid
+from policy_store import PolicyStore
 from fastapi.middleware.cors import CORSMiddleware
+from instrumentation import instrument, metrics
 
 # --- Configuration ---
 DB_FILE = "policies.json"
+JOURNAL_FILE = "policies.journal"
+PROFILING_ENABLED = False # exposes GET /debug/profile, a sampling profiler of the running process
+# Operators understood by the anomaly detection service's policy engine (OPERATORS, REGEX_OPERATORS and
+# COMPARISON_OPERATORS in its policy_engine.py).
+COMPARISON_OPERATORS = {">", "<", ">=", "<=", "==", "!="}
+RULE_OPERATORS = COMPARISON_OPERATORS | {"in", "contains", "regex", "matches"}
 
 # --- FastAPI App Initialization ---
 app = FastAPI(
@@ -24,6 +36,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+instrument(app, "policy", profiling=PROFILING_ENABLED)
 
 # --- Pydantic Models ---
 class Policy(BaseModel):
@@ -31,41 +44,151 @@ class Policy(BaseModel):
     name: str
     description: str
     data_type: str # e.g., "transaction", "loan_application"
-    rules: List[Dict[str, Any]]
+    rules: List[Dict[str, Any]] # {"field", "operator", "value"}, or a WindowRule with "type": "window"
+
+class WindowRule(BaseModel):
+    """A limit on a user's count or sum of the policy's event type over a sliding window."""
+    type: str = "window"
+    aggregate: str = "count" # "count" of events, or "sum" of `field`
+    field: Optional[str] = None
+    window_seconds: int
+    operator: str
+    value: float
+    relative_to_norm: bool = False # compare the window total divided by the user's usual total
+
+class PolicySnapshot(BaseModel):
+    etag: str
+    revision: int
+    policies: List[Policy]
+
+# --- Change Feed ---
+class PolicyChangeFeed:
+    """
+    Exposes the store revision as an ETag and wakes long-poll waiters on change. The ETag
+    also carries a per-process epoch so clients notice when the service restarts.
+    """
+
+    def __init__(self):
+        self.epoch = uuid.uuid4().hex[:8]
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._changed: Optional[asyncio.Event] = None
+
+    def etag_for(self, revision: int) -> str:
+        return f'"{self.epoch}-{revision}"'
+
+    @property
+    def etag(self) -> str:
+        return self.etag_for(store.revision)
 
-# --- Helper Functions ---
-def load_policies() -> Dict[str, Policy]:
-    if not os.path.exists(DB_FILE):
-        return {}
-    with open(DB_FILE, "r") as f:
-        data = json.load(f)
-        return {item['id']: Policy(**item) for item in data}
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self._changed = asyncio.Event()
 
-def save_policies(policies: Dict[str, Policy]):
-    with open(DB_FILE, "w") as f:
-        json.dump([p.dict() for p in policies.values()], f, indent=2)
+    def notify(self):
+        """Called by writers, which run in the threadpool."""
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._notify)
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait_for_change(self, etag: str, timeout: float) -> bool:
+        """Waits until the current ETag differs from `etag`. Returns False on timeout."""
+        if etag != self.etag:
+            return True
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+change_feed = PolicyChangeFeed()
+store = PolicyStore(DB_FILE, JOURNAL_FILE, on_change=change_feed.notify)
+metrics.gauge("phalanx_policy_revision", "Revision of the policy store.", lambda: store.revision)
+
+def validate_rules(policy: Policy):
+    """Rejects rules the detector's policy engine would skip, so a policy never silently stops firing."""
+    for rule in policy.rules:
+        error = rule_error(rule)
+        if error:
+            raise HTTPException(status_code=400, detail=f"Invalid rule {rule} in policy {policy.id}: {error}")
+
+def rule_error(rule: Dict[str, Any]) -> Optional[str]:
+    if rule.get("type") == "window":
+        try:
+            window = WindowRule(**rule)
+        except ValidationError as e:
+            return str(e)
+        if window.aggregate not in ("count", "sum"):
+            return "aggregate must be 'count' or 'sum'."
+        if window.aggregate == "sum" and not window.field:
+            return "a sum needs a field."
+        if window.window_seconds <= 0:
+            return "window_seconds must be positive."
+        if window.operator not in COMPARISON_OPERATORS:
+            return f"operator must be one of {', '.join(sorted(COMPARISON_OPERATORS))}."
+        return None
+    if not all(name in rule for name in ("field", "operator", "value")):
+        return "a rule needs a field, an operator and a value."
+    if rule["operator"] not in RULE_OPERATORS:
+        return f"operator must be one of {', '.join(sorted(RULE_OPERATORS))}."
+    if rule["operator"] in ("regex", "matches"):
+        try:
+            re.compile(str(rule["value"]))
+        except re.error as e:
+            return f"invalid regex: {e}"
+    return None
 
 # --- API Endpoints ---
+@app.on_event("startup")
+async def startup_event():
+    change_feed.bind(asyncio.get_running_loop())
+
+@app.on_event("shutdown")
+def shutdown_event():
+    store.close()
+
 @app.get("/policies", response_model=List[Policy])
-def get_policies():
-    """Retrieves a list of all configured policies."""
-    policies = load_policies()
-    return list(policies.values())
+def get_policies(if_none_match: Optional[str] = Header(None)):
+    """Retrieves a list of all configured policies. Supports conditional GETs via If-None-Match."""
+    revision, body = store.snapshot()
+    etag = change_feed.etag_for(revision)
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+@app.get("/policies/changes", response_model=PolicySnapshot)
+async def watch_policies(etag: str = "", timeout: float = 30):
+    """
+    Long-poll change feed. Returns the full policy snapshot as soon as its ETag differs
+    from `etag`, or 304 if nothing changed within `timeout` seconds.
+    """
+    if not await change_feed.wait_for_change(etag, min(timeout, 60)):
+        return Response(status_code=304, headers={"ETag": change_feed.etag})
+    revision, body = store.snapshot()
+    current = change_feed.etag_for(revision)
+    content = b'{"etag": %s, "revision": %d, "policies": %s}' % (json.dumps(current).encode(), revision, body)
+    return Response(content=content, media_type="application/json", headers={"ETag": current})
 
 @app.post("/policies", response_model=Policy)
 def create_or_update_policy(policy: Policy):
     """Creates a new policy or updates an existing one."""
-    policies = load_policies()
-    policies[policy.id] = policy
-    save_policies(policies)
+    validate_rules(policy)
+    store.put(policy.dict())
     return policy
 
+@app.post("/policies/bulk")
+def bulk_upsert_policies(policies: List[Policy]):
+    """Creates or updates many policies with a single journal write."""
+    for policy in policies:
+        validate_rules(policy)
+    store.put_many(p.dict() for p in policies)
+    return {"message": f"Upserted {len(policies)} policies.", "count": len(policies)}
+
 @app.delete("/policies/{policy_id}", status_code=204)
 def delete_policy(policy_id: str):
     """Deletes a policy by its ID."""
-    policies = load_policies()
-    if policy_id not in policies:
+    if not store.delete(policy_id):
         raise HTTPException(status_code=404, detail="Policy not found.")
-    del policies[policy_id]
-    save_policies(policies)
     return
@@ -0,0 +1,130 @@
+import json
+import logging
+import os
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+COMPACT_THRESHOLD = 1000
+
+class PolicyStore:
+    """
+    In-memory policy store persisted as a JSON snapshot plus an append-only journal.
+
+    Every write appends one JSON line per change to the journal and fsyncs it before
+    the in-memory table is updated. Once the journal holds `compact_threshold` entries
+    it is folded into a new snapshot (written to a temp file and renamed into place)
+    and truncated. Writers are serialised by a lock; readers get the cached table.
+    `revision` is bumped on every write and `on_change` is called while the lock is held.
+    """
+
+    def __init__(self, snapshot_file: str, journal_file: str, compact_threshold: int = COMPACT_THRESHOLD,
+                 on_change: Optional[Callable[[], None]] = None):
+        self.snapshot_file = snapshot_file
+        self.journal_file = journal_file
+        self.compact_threshold = compact_threshold
+        self.on_change = on_change
+        self.revision = 0
+        self._policies: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._journal_entries = 0
+        self._journal_corrupt = False
+        self._cached_json: Optional[bytes] = None
+        self._load()
+        self._journal = open(self.journal_file, "a", encoding="utf-8")
+        # Also compact past a corrupt entry, or the next append would be joined onto it and lost.
+        if self._journal_entries or self._journal_corrupt:
+            self._compact()
+
+    # --- Reads ---
+    def get(self, policy_id: str) -> Optional[dict]:
+        return self._policies.get(policy_id)
+
+    def list(self) -> List[dict]:
+        return list(self._policies.values())
+
+    def snapshot(self) -> Tuple[int, bytes]:
+        """The revision and the full policy list encoded as JSON, cached until the next write."""
+        with self._lock:
+            if self._cached_json is None:
+                self._cached_json = json.dumps(list(self._policies.values())).encode()
+            return self.revision, self._cached_json
+
+    def __len__(self) -> int:
+        return len(self._policies)
+
+    # --- Writes ---
+    def put(self, policy: dict):
+        self.put_many([policy])
+
+    def put_many(self, policies: Iterable[dict]):
+        entries = [{"op": "put", "policy": policy} for policy in policies]
+        with self._lock:
+            self._append(entries)
+            for entry in entries:
+                self._policies[entry["policy"]["id"]] = entry["policy"]
+            self._after_write()
+
+    def delete(self, policy_id: str) -> bool:
+        with self._lock:
+            if policy_id not in self._policies:
+                return False
+            self._append([{"op": "delete", "id": policy_id}])
+            del self._policies[policy_id]
+            self._after_write()
+            return True
+
+    def close(self):
+        with self._lock:
+            self._journal.close()
+
+    # --- Persistence ---
+    def _load(self):
+        if os.path.exists(self.snapshot_file):
+            with open(self.snapshot_file, "r", encoding="utf-8") as f:
+                self._policies = {item['id']: item for item in json.load(f)}
+        if not os.path.exists(self.journal_file):
+            return
+        with open(self.journal_file, "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final write from a crash; everything before it is intact.
+                    logging.warning(f"Ignoring corrupt journal entry at {self.journal_file}:{line_no}")
+                    self._journal_corrupt = True
+                    break
+                self._replay(entry)
+                self._journal_entries += 1
+
+    def _replay(self, entry: dict):
+        if entry["op"] == "put":
+            self._policies[entry["policy"]["id"]] = entry["policy"]
+        elif entry["op"] == "delete":
+            self._policies.pop(entry["id"], None)
+
+    def _append(self, entries: List[dict]):
+        self._journal.write("".join(json.dumps(entry) + "\n" for entry in entries))
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        self._journal_entries += len(entries)
+
+    def _after_write(self):
+        self._cached_json = None
+        self.revision += 1
+        if self.on_change:
+            self.on_change()
+        if self._journal_entries >= self.compact_threshold:
+            self._compact()
+
+    def _compact(self):
+        """Writes the current table as a new snapshot and truncates the journal."""
+        tmp_file = f"{self.snapshot_file}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(list(self._policies.values()), f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.snapshot_file)
+        self._journal.truncate(0)
+        self._journal.seek(0)
+        self._journal_entries = 0
+        self._journal_corrupt = False
@@ -0,0 +1,129 @@
+"""
+Wire formats shared by the Phalanx services: JSON, serialised with orjson when it is
+installed, and MessagePack, a compact binary encoding of the same values.
+
+Endpoints on a `WireRoute` accept either format, chosen by the request's Content-Type,
+and answer with `WireResponse` in the format named by its Accept header. JSON stays the
+default. A MessagePack request gets 415 when msgpack is not installed, so clients can
+fall back to JSON.
+"""
+import contextvars
+import json
+from typing import Any, Callable, Optional
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+MSGPACK_TYPES = {MSGPACK, "application/x-msgpack", "application/vnd.msgpack"}
+FORMATS = [JSON, MSGPACK] if msgpack else [JSON]
+
+# --- Codecs ---
+def dumps(obj: Any, default: Optional[Callable[[Any], Any]] = None) -> bytes:
+    """
+    Serialises to compact UTF-8 JSON. A `default` hook also sees datetimes, as with the
+    stdlib encoder, so BSON's json_util.default produces the same output either way.
+    """
+    if orjson:
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if default:
+            option |= orjson.OPT_PASSTHROUGH_DATETIME
+        return orjson.dumps(obj, default=default, option=option)
+    return json.dumps(obj, default=default, separators=(",", ":"), ensure_ascii=False).encode()
+
+def loads(data) -> Any:
+    return orjson.loads(data) if orjson else json.loads(data)
+
+def media_type(header: Optional[str]) -> Optional[str]:
+    """The wire format named by a Content-Type or Accept value; None if it is not one of ours."""
+    if not header:
+        return None
+    for item in header.split(","):
+        value = item.split(";", 1)[0].strip().lower()
+        if value in MSGPACK_TYPES:
+            return MSGPACK
+        if value == JSON or value.endswith("+json"):
+            return JSON
+    return None
+
+def _to_builtin(obj: Any) -> Any:
+    """MessagePack fallback for NumPy scalars and arrays, which orjson handles natively."""
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    raise TypeError(f"Cannot serialise {type(obj).__name__}")
+
+def encode(obj: Any, fmt: str = JSON) -> bytes:
+    if fmt == MSGPACK:
+        return msgpack.packb(obj, use_bin_type=True, default=_to_builtin)
+    return dumps(obj)
+
+def decode(data: bytes, fmt: str = JSON) -> Any:
+    if fmt == MSGPACK:
+        return msgpack.unpackb(data, raw=False)
+    return loads(data)
+
+# --- FastAPI Integration ---
+_response_format: contextvars.ContextVar[str] = contextvars.ContextVar("response_format", default=JSON)
+
+class WireRequest(Request):
+    """Decodes the body in the request's wire format wherever FastAPI asks for JSON."""
+
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            fmt = self.scope.get("wire.format", JSON)
+            body = await self.body()
+            try:
+                self._json = decode(body, fmt)
+            except json.JSONDecodeError:
+                raise
+            except Exception as e:
+                # Reported by FastAPI as a 422, like malformed JSON.
+                raise json.JSONDecodeError(f"Invalid {fmt} body: {e}", "", 0) from e
+        return self._json
+
+class WireRoute(APIRoute):
+    """
+    Route that reads JSON or MessagePack bodies and makes the Accept header's format
+    current for WireResponse. FastAPI only hands JSON content types to the body parser,
+    so a MessagePack request is relabelled as JSON and decoded by WireRequest.
+    """
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def route_handler(request: Request) -> Response:
+            scope = request.scope
+            if media_type(request.headers.get("content-type")) == MSGPACK:
+                if msgpack is None:
+                    return Response(status_code=415, headers={"Accept": ", ".join(FORMATS)})
+                scope["wire.format"] = MSGPACK
+                scope["headers"] = [
+                    (name, JSON.encode() if name == b"content-type" else value) for name, value in scope["headers"]
+                ]
+            accepted = media_type(request.headers.get("accept"))
+            token = _response_format.set(MSGPACK if accepted == MSGPACK and msgpack else JSON)
+            try:
+                return await handler(WireRequest(scope, request.receive))
+            finally:
+                _response_format.reset(token)
+
+        return route_handler
+
+class WireResponse(Response):
+    """Renders its content in the format negotiated by WireRoute (JSON elsewhere)."""
+    media_type = JSON
+
+    def render(self, content: Any) -> bytes:
+        fmt = _response_format.get()
+        self.media_type = fmt
+        return encode(content, fmt)
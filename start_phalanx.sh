@@ -33,7 +33,25 @@ wait_for_service() {
   until curl -s -f -o /dev/null "$URL"
   do
     echo "Service not yet available, waiting..."
-    sleep 5
+    sleep 1
+  done
+  echo "Service is ready!"
+}
+
+wait_for_ready() {
+  URL=$1
+  echo "Waiting for $URL to report ready..."
+  while true
+  do
+    STATUS=$(curl -s -o /tmp/phalanx_ready.json -w "%{http_code}" "$URL" || true)
+    if [ "$STATUS" = "200" ]; then
+      break
+    elif [ "$STATUS" = "500" ]; then
+      echo "Service failed to start: $(cat /tmp/phalanx_ready.json)"
+      exit 1
+    fi
+    echo "Service not yet ready, waiting..."
+    sleep 1
   done
   echo "Service is ready!"
 }
@@ -117,8 +135,12 @@ cd services/anomaly-detection-service
 install_python_dependencies
 echo "Starting anomaly detection service..."
 source .venv/bin/activate
-uvicorn main:app --reload --port 8000 &
-sleep 5
+# ANOMALY_WORKERS=N runs N detector processes on one port, sharing state on local disk.
+if [ "${ANOMALY_WORKERS:-1}" -gt 1 ]; then
+  uvicorn main:app --port 8000 --workers "$ANOMALY_WORKERS" &
+else
+  uvicorn main:app --reload --port 8000 &
+fi
 cd ../..
 
 # --- Database Integration Service ---
@@ -129,7 +151,6 @@ install_python_dependencies
 echo "Starting database integration service..."
 source .venv/bin/activate
 uvicorn main:app --reload --port 8001 &
-sleep 5
 cd ../..
 
 # --- Compliance Automation Service ---
@@ -140,7 +161,6 @@ install_python_dependencies
 echo "Starting compliance automation service..."
 source .venv/bin/activate
 uvicorn main:app --reload --port 8002 &
-sleep 5
 cd ../..
 
 # --- Policy Service ---
@@ -170,12 +190,11 @@ wait_for_mongo "localhost" 27017
 populate_mongodb
 
 # Wait for all services to be ready
-wait_for_service "http://localhost:8000/docs"
 wait_for_service "http://localhost:8001/docs"
 wait_for_service "http://localhost:8002/docs"
 wait_for_service "http://localhost:8005/docs"
-
-sleep 10 # Give services extra time to fully initialize
+# /ready returns 503 until the anomaly service's models are loaded and warmed up, 500 if that failed
+wait_for_ready "http://localhost:8000/ready"
 
 echo "--- Running DORA Incident Simulator ---"
 cd services/anomaly-detection-service